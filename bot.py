@@ -1,29 +1,60 @@
+import hashlib
 import logging
+import multiprocessing
 import os
-import sqlite3
+import re
+import signal
+import time
 import asyncio
+import aiosqlite
+from contextlib import asynccontextmanager
+import orjson
 import datetime
+from collections import Counter
+from functools import lru_cache
 from urllib.parse import urlparse
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, types
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.filters import BaseFilter, CommandStart, Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.markdown import hbold, hcode
+from aiogram.utils.text_decorations import html_decoration
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
 from aiohttp import web
+try:
+    import uvloop # Not available on Windows, where the default asyncio loop is used
+except ImportError:
+    uvloop = None
 
 # Load .env variables
 load_dotenv()
 
 # --- Configuration from Environment Variables ---
 API_TOKEN = os.getenv("BOT_TOKEN")
-ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
+# Parsed once here so a missing or malformed value fails at startup, not on the first admin command.
+# Several admins may be listed comma-separated; click notifications go to the first one.
+_admin_ids = [int(admin_id) for admin_id in os.getenv("ADMIN_CHAT_ID", "").split(",") if admin_id.strip()]
+if not _admin_ids:
+    raise RuntimeError("ADMIN_CHAT_ID must list at least one admin Telegram id (comma-separated)")
+ADMIN_CHAT_ID = _admin_ids[0]
+ADMIN_IDS = frozenset(_admin_ids)
 WEB_SERVER_URL = os.getenv("WEB_SERVER_URL") # Example: https://your-render-app.onrender.com
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1")) # Processes serving /track-click; only the first one runs the bot
+WEBHOOK_PATH = "/tg-webhook"
+# Checked against X-Telegram-Bot-Api-Secret-Token on every webhook call. Without it any POST to WEBHOOK_PATH would be
+# dispatched as an update, so when unset one is derived from the bot token (only Telegram and this process know it).
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{API_TOKEN}".encode()).hexdigest()
+# FSM state lives in process memory, so updates may only arrive at one process: webhooks need a single web worker
+USE_WEBHOOK = bool(WEB_SERVER_URL) and WEB_WORKERS == 1
 
 # --- Bot Initialization ---
-bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# One pooled HTTP session for every Bot API call, so admin notifications reuse keep-alive connections
+bot = Bot(token=API_TOKEN, session=AiohttpSession(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 logging.basicConfig(level=logging.INFO)
 
@@ -47,19 +78,37 @@ class Withdrawal(StatesGroup):
     comment = State()
 
 # --- SQLite Database Setup ---
-conn = sqlite3.connect("bot.db")
-cur = conn.cursor()
+DB_PATH = "bot.db"
 
-# Create/Update tables
-# employees table: user details and profile info, now with banned and is_editor flags
-cur.execute("""
+# Shared aiosqlite connection, opened once by init_db() on startup
+db: aiosqlite.Connection = None
+
+# Read-only connections for the hot SELECTs (/track-click checks, balance and withdraw lookups).
+# Under WAL each one reads on its own thread alongside the others and the writer `db`.
+READ_POOL_SIZE = 4
+read_pool: asyncio.Queue = None
+
+# Usernames of all registered employees, loaded by init_db() and kept in sync by the add/delete handlers
+employees_cache: set[str] = set()
+
+# Telegram ids of the editors, loaded by init_db() and reloaded whenever an employee row changes
+editor_ids: set[int] = set()
+
+# USDT paid per 1000 visits (0.0 when unset), loaded by init_db() and updated by /set_usdt.
+# Only the main process handles commands, so no other process needs to see the change.
+usdt_rate_per_1000: float = 0.0
+
+# Bump SCHEMA_VERSION whenever SCHEMA_SQL changes so existing databases pick the change up on the next start
+SCHEMA_VERSION = 7
+SCHEMA_SQL = """
+-- employees table: user details and profile info, now with banned and is_editor flags
 CREATE TABLE IF NOT EXISTS employees (
     username TEXT PRIMARY KEY,
     telegram_id INTEGER UNIQUE,
-    is_admin BOOLEAN DEFAULT 0,
-    is_editor BOOLEAN DEFAULT 0,
-    profile_set BOOLEAN DEFAULT 0,
-    banned BOOLEAN DEFAULT 0,
+    is_admin INTEGER NOT NULL DEFAULT 0,
+    is_editor INTEGER NOT NULL DEFAULT 0,
+    profile_set INTEGER NOT NULL DEFAULT 0,
+    banned INTEGER NOT NULL DEFAULT 0,
     full_name TEXT,
     phone_number TEXT,
     email TEXT,
@@ -73,31 +122,28 @@ CREATE TABLE IF NOT EXISTS employees (
     total_visits INTEGER DEFAULT 0,
     total_clicks INTEGER DEFAULT 0,
     usdt_balance REAL DEFAULT 0.0
-)
-""")
+) WITHOUT ROWID;
+
+-- /report's top employees walk this backwards instead of sorting the whole table
+CREATE INDEX IF NOT EXISTS idx_employees_total_visits ON employees(total_visits);
 
-# domains table: to store allowed movie site domains (from previous)
-cur.execute("""
+-- domains table: to store allowed movie site domains (from previous)
 CREATE TABLE IF NOT EXISTS domains (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT UNIQUE,
     base_url TEXT
-)
-""")
+);
 
-# global_tasks table: for a single task assigned to all employees (from previous)
-cur.execute("""
+-- global_tasks table: for a single task assigned to all employees (from previous)
 CREATE TABLE IF NOT EXISTS global_tasks (
     id INTEGER PRIMARY KEY DEFAULT 1,
     task_identifier TEXT,
     domain_id INTEGER,
     last_set_date TEXT,
     FOREIGN KEY (domain_id) REFERENCES domains(id)
-)
-""")
+);
 
-# individual_tasks table: for tasks assigned to specific employees (from previous)
-cur.execute("""
+-- individual_tasks table: for tasks assigned to specific employees (from previous)
 CREATE TABLE IF NOT EXISTS individual_tasks (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     employee_username TEXT,
@@ -108,11 +154,9 @@ CREATE TABLE IF NOT EXISTS individual_tasks (
     status TEXT DEFAULT 'pending',
     FOREIGN KEY (employee_username) REFERENCES employees(username),
     FOREIGN KEY (domain_id) REFERENCES domains(id)
-)
-""")
+);
 
-# clicks table: to track user clicks and duration, now with more details
-cur.execute("""
+-- clicks table: to track user clicks and duration, now with more details
 CREATE TABLE IF NOT EXISTS clicks (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ref_by_employee TEXT, -- The employee's username
@@ -122,44 +166,97 @@ CREATE TABLE IF NOT EXISTS clicks (
     user_agent TEXT, -- Browser user agent
     page_url TEXT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    is_visit BOOLEAN DEFAULT 0, -- True if stayed >= 12 seconds
-    is_click BOOLEAN DEFAULT 0, -- True if detected, regardless of duration
-    is_telegram_browser BOOLEAN DEFAULT 0, -- True if opened in Telegram's internal browser
+    is_visit INTEGER NOT NULL DEFAULT 0, -- True if stayed >= 12 seconds
+    is_click INTEGER NOT NULL DEFAULT 0, -- True if detected, regardless of duration
+    is_telegram_browser INTEGER NOT NULL DEFAULT 0, -- True if opened in Telegram's internal browser
     unique_daily_key TEXT UNIQUE -- For 20 visits per day limit (username + date + ref_by_employee + page_url)
-)
-""")
-
-# New tables for public lists
-cur.execute("""
+);
+-- Indexes for the per-viewer daily click limit check run on every /track-click request
+CREATE INDEX IF NOT EXISTS idx_clicks_viewer_tid ON clicks(viewer_telegram_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_clicks_viewer_username ON clicks(viewer_username, timestamp);
+
+-- Clicks older than yesterday, moved here by clicks_archiver() so clicks and its indexes only hold recent days.
+-- Same columns as clicks; ids are kept, and no constraints are needed since rows only arrive from clicks.
+CREATE TABLE IF NOT EXISTS clicks_archive (
+    id INTEGER PRIMARY KEY,
+    ref_by_employee TEXT,
+    viewer_telegram_id INTEGER,
+    viewer_username TEXT,
+    viewer_full_name TEXT,
+    user_agent TEXT,
+    page_url TEXT,
+    timestamp DATETIME,
+    is_visit INTEGER NOT NULL DEFAULT 0,
+    is_click INTEGER NOT NULL DEFAULT 0,
+    is_telegram_browser INTEGER NOT NULL DEFAULT 0,
+    unique_daily_key TEXT
+);
+
+-- counters table: running click and visit totals over clicks + clicks_archive, so /report doesn't count them.
+-- Seeded from the existing rows once, then kept by the triggers below. clicks_archiver() moves rows into
+-- clicks_archive rather than dropping them, so deletes from clicks leave the totals alone.
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO counters (name, value)
+SELECT 'clicks', COUNT(*) FROM (SELECT id FROM clicks UNION ALL SELECT id FROM clicks_archive);
+INSERT OR IGNORE INTO counters (name, value)
+SELECT 'visits', COUNT(*) FROM (SELECT id FROM clicks WHERE is_visit = 1 UNION ALL SELECT id FROM clicks_archive WHERE is_visit = 1);
+CREATE TRIGGER IF NOT EXISTS trg_clicks_insert AFTER INSERT ON clicks BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'clicks';
+    UPDATE counters SET value = value + 1 WHERE name = 'visits' AND NEW.is_visit = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_clicks_visit AFTER UPDATE OF is_visit ON clicks WHEN (NEW.is_visit = 1) <> (OLD.is_visit = 1) BEGIN
+    UPDATE counters SET value = value + (CASE WHEN NEW.is_visit = 1 THEN 1 ELSE -1 END) WHERE name = 'visits';
+END;
+
+-- click_viewers table: one row per distinct viewer who ever clicked, with their latest click id, for /click_user_list.
+-- Seeded from the existing rows once, then kept by the trigger below, so the list never reads the click history.
+-- Missing values are stored as '' / 0 because UNIQUE treats NULLs as distinct.
+CREATE TABLE IF NOT EXISTS click_viewers (
+    viewer_username TEXT NOT NULL,
+    viewer_full_name TEXT NOT NULL,
+    viewer_telegram_id INTEGER NOT NULL,
+    last_click_id INTEGER NOT NULL,
+    UNIQUE (viewer_username, viewer_full_name, viewer_telegram_id)
+);
+INSERT OR IGNORE INTO click_viewers (viewer_username, viewer_full_name, viewer_telegram_id, last_click_id)
+SELECT IFNULL(viewer_username, ''), IFNULL(viewer_full_name, ''), IFNULL(viewer_telegram_id, 0), MAX(id)
+FROM (SELECT id, viewer_username, viewer_full_name, viewer_telegram_id FROM clicks
+      UNION ALL
+      SELECT id, viewer_username, viewer_full_name, viewer_telegram_id FROM clicks_archive)
+GROUP BY 1, 2, 3;
+CREATE TRIGGER IF NOT EXISTS trg_clicks_viewer AFTER INSERT ON clicks BEGIN
+    INSERT INTO click_viewers (viewer_username, viewer_full_name, viewer_telegram_id, last_click_id)
+    VALUES (IFNULL(NEW.viewer_username, ''), IFNULL(NEW.viewer_full_name, ''), IFNULL(NEW.viewer_telegram_id, 0), NEW.id)
+    ON CONFLICT (viewer_username, viewer_full_name, viewer_telegram_id) DO UPDATE SET last_click_id = excluded.last_click_id;
+END;
+
+-- New tables for public lists
 CREATE TABLE IF NOT EXISTS channels (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT UNIQUE,
     description TEXT,
     link TEXT UNIQUE
-)
-""")
+);
 
-cur.execute("""
 CREATE TABLE IF NOT EXISTS earning_bots (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT UNIQUE,
     description TEXT,
     link TEXT UNIQUE
-)
-""")
+);
 
-# Global settings for visit to USDT rate
-cur.execute("""
+-- Global settings for visit to USDT rate
 CREATE TABLE IF NOT EXISTS global_settings (
     key TEXT PRIMARY KEY,
     value TEXT
-)
-""")
-# Initialize default USDT rate if not exists
-cur.execute("INSERT OR IGNORE INTO global_settings (key, value) VALUES (?, ?)", ('usdt_rate_per_1000_visits', '1.00'))
+) WITHOUT ROWID;
+-- Initialize default USDT rate if not exists
+INSERT OR IGNORE INTO global_settings (key, value) VALUES ('usdt_rate_per_1000_visits', '1.00');
 
-# New table for withdrawal requests
-cur.execute("""
+-- New table for withdrawal requests
 CREATE TABLE IF NOT EXISTS withdraw_requests (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     employee_username TEXT,
@@ -170,23 +267,225 @@ CREATE TABLE IF NOT EXISTS withdraw_requests (
     request_date DATETIME DEFAULT CURRENT_TIMESTAMP,
     status TEXT DEFAULT 'pending', -- 'pending', 'approved', 'rejected'
     FOREIGN KEY (employee_username) REFERENCES employees(username)
-)
-""")
-
-conn.commit()
+);
+-- /my_balance counts an employee's pending requests; /report lists the latest pending ones
+CREATE INDEX IF NOT EXISTS idx_withdraw_employee_status ON withdraw_requests(employee_username, status);
+CREATE INDEX IF NOT EXISTS idx_withdraw_status_date ON withdraw_requests(status, request_date);
+-- Deleting an employee removes their individual tasks
+CREATE INDEX IF NOT EXISTS idx_individual_tasks_employee ON individual_tasks(employee_username);
+"""
+
+# Tables whose declaration changed after databases were deployed (WITHOUT ROWID, INTEGER NOT NULL DEFAULT 0 flags).
+# CREATE TABLE IF NOT EXISTS leaves an existing table alone, so these are rebuilt to their SCHEMA_SQL declaration.
+REBUILT_TABLES = ("employees", "global_settings", "clicks")
+
+# The table's CREATE TABLE from SCHEMA_SQL, as sqlite_master stores it (no IF NOT EXISTS, no semicolon)
+def schema_table_sql(table):
+    match = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \(.*?\n\)[^;\n]*", SCHEMA_SQL, re.S)
+    return match[0].replace("IF NOT EXISTS ", "", 1)
+
+# Rebuilds `table` in place with `table_sql`, inside the caller's transaction
+async def rebuild_table(table, table_sql):
+    # DROP TABLE takes the indexes, triggers and AUTOINCREMENT position with it; they are read first and restored
+    cur = await db.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL", (table,))
+    dependents = [row[0] for row in await cur.fetchall()]
+    cur = await db.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    sequence = await cur.fetchone()
+
+    await db.execute(table_sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE {table}_new", 1))
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    old_columns = {row[1] for row in await cur.fetchall()}
+    cur = await db.execute(f"PRAGMA table_info({table}_new)")
+    columns, values = [], []
+    for _, name, _, notnull, default, _ in await cur.fetchall():
+        if name in old_columns:
+            columns.append(name)
+            # A NULL left in a column that is NOT NULL now takes the column's default
+            values.append(f"IFNULL({name}, {default})" if notnull and default is not None else name)
+    await db.execute(f"INSERT INTO {table}_new ({', '.join(columns)}) SELECT {', '.join(values)} FROM {table}")
+    await db.execute(f"DROP TABLE {table}")
+    await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    for sql in dependents:
+        await db.execute(sql)
+    if sequence:
+        # Archived rows keep their ids, so new ids must carry on after the old sequence, not after what is left
+        await db.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        await db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+    logging.info(f"Rebuilt {table} to its current declaration")
+
+async def init_db():
+    global db
+    # sqlite3 reuses a compiled statement whenever the same SQL text runs again; room for every query in this file
+    db = await aiosqlite.connect(DB_PATH, cached_statements=256)
+
+    # WAL lets readers run while a write is in progress; NORMAL sync is safe under WAL
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA cache_size=-64000")
+    # Reads are served straight from the memory-mapped file instead of being copied into the page cache
+    await db.execute("PRAGMA mmap_size=268435456")
+    # Web worker processes write through their own connections; wait for their locks instead of failing with "database is locked"
+    await db.execute("PRAGMA busy_timeout=10000")
+
+    # The schema only has to be (re)applied when the file is older than SCHEMA_VERSION, so most restarts skip it.
+    # Everything runs in one IMMEDIATE transaction: a web worker starting at the same time waits instead of racing it.
+    cur = await db.execute("PRAGMA user_version")
+    if (await cur.fetchone())[0] < SCHEMA_VERSION:
+        await db.executescript("BEGIN IMMEDIATE;\n" + SCHEMA_SQL)
+        # Tables still declared the way an older version created them are rebuilt once, in place
+        for table in REBUILT_TABLES:
+            table_sql = schema_table_sql(table)
+            cur = await db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            # ALTER TABLE ... RENAME stores the new name quoted, so a table rebuilt earlier reads CREATE TABLE "name"
+            stored_sql = (await cur.fetchone())[0].replace(f'CREATE TABLE "{table}"', f"CREATE TABLE {table}", 1)
+            if stored_sql != table_sql:
+                await rebuild_table(table, table_sql)
+        await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        await db.commit()
+
+    cur = await db.execute("SELECT username FROM employees")
+    employees_cache.update(row[0] for row in await cur.fetchall())
+    await load_editor_ids()
+
+    global usdt_rate_per_1000
+    cur = await db.execute("SELECT value FROM global_settings WHERE key = 'usdt_rate_per_1000_visits'")
+    usdt_rate_str = await cur.fetchone()
+    usdt_rate_per_1000 = float(usdt_rate_str[0]) if usdt_rate_str else 0.0
+
+    # Opened after the schema is in place: mode=ro connections cannot create the file or its tables
+    global read_pool
+    read_pool = asyncio.Queue()
+    for _ in range(READ_POOL_SIZE):
+        conn = await aiosqlite.connect(f"file:{DB_PATH}?mode=ro", uri=True, cached_statements=256)
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA mmap_size=268435456")
+        await conn.execute("PRAGMA busy_timeout=10000")
+        read_pool.put_nowait(conn)
+
+# PRAGMA optimize refreshes the planner statistics for tables whose indexes have been used heavily since the last run
+DB_OPTIMIZE_INTERVAL = 15 * 60
+
+async def db_optimizer():
+    while True:
+        await asyncio.sleep(DB_OPTIMIZE_INTERVAL)
+        try:
+            async with db_write_lock: # May run ANALYZE, which must not land in another coroutine's transaction
+                await db.execute("PRAGMA optimize")
+        except Exception as e:
+            logging.error(f"PRAGMA optimize failed: {e}")
+
+# Once a day clicks from before yesterday move to clicks_archive. Their unique_daily_key can never match a new
+# visit again, so the daily-limit and duplicate checks only ever need the last two days.
+CLICKS_ARCHIVE_INTERVAL = 24 * 60 * 60
+
+async def clicks_archiver():
+    while True:
+        cutoff = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        try:
+            async with write_transaction():
+                await db.execute("""
+                    INSERT INTO clicks_archive (id, ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name, user_agent,
+                                                page_url, timestamp, is_visit, is_click, is_telegram_browser, unique_daily_key)
+                    SELECT id, ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name, user_agent,
+                           page_url, timestamp, is_visit, is_click, is_telegram_browser, unique_daily_key
+                    FROM clicks WHERE timestamp < ?
+                """, (cutoff,))
+                cur = await db.execute("DELETE FROM clicks WHERE timestamp < ?", (cutoff,))
+            if cur.rowcount:
+                logging.info(f"Archived {cur.rowcount} clicks from before {cutoff}")
+        except Exception as e:
+            logging.error(f"Failed to archive clicks: {e}")
+        await asyncio.sleep(CLICKS_ARCHIVE_INTERVAL)
+
+# Borrow a read-only connection for SELECTs; writes always go through `db`
+@asynccontextmanager
+async def reader():
+    conn = await read_pool.get()
+    try:
+        yield conn
+    finally:
+        read_pool.put_nowait(conn)
+
+# Every write on the shared `db` runs inside write_transaction(). The lock hands the connection to one coroutine
+# for a whole transaction, so a handler's statements are never committed or rolled back by another coroutine's
+# commit/rollback in the middle of an await. BEGIN IMMEDIATE takes SQLite's write lock up front (a web worker
+# holding it is waited for via busy_timeout); the block commits when it ends, early returns included, and rolls
+# back if it raises. Replies and other network calls belong after the block, not inside it.
+db_write_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def write_transaction():
+    async with db_write_lock:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
 
 # --- Helper functions ---
 def is_admin(user_id):
-    return str(user_id) == ADMIN_CHAT_ID
+    return user_id in ADMIN_IDS
+
+# Telegram rejects messages over 4096 characters; longer texts are sent as several messages
+MESSAGE_CHUNK_LIMIT = 4000
+
+def split_message(text, limit=MESSAGE_CHUNK_LIMIT):
+    chunks, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit: # A single oversized line is cut hard
+            if current:
+                chunks.append("".join(current))
+                current, size = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if size + len(line) > limit:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+# Short-lived caches for the lookups that run on almost every message. Entries are (expires_at, value);
+# the handlers that change employees or the public lists clear them straight away.
+STATUS_CACHE_TTL = 60
+LIST_CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 10000
+_employee_status_cache = {} # (telegram_id, username) -> (profile_set, banned) or None
+_list_cache = {} # command name -> rendered list text or None
+
+def cache_get(cache, key):
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry
+    return None
+
+def cache_set(cache, key, value, ttl=STATUS_CACHE_TTL):
+    if len(cache) >= CACHE_MAX_ENTRIES:
+        cache.clear()
+    cache[key] = (time.monotonic() + ttl, value)
+
+async def load_editor_ids():
+    cur = await db.execute("SELECT telegram_id FROM employees WHERE is_editor = 1 AND telegram_id IS NOT NULL")
+    rows = await cur.fetchall()
+    editor_ids.clear()
+    editor_ids.update(row[0] for row in rows)
+
+async def invalidate_employee_caches():
+    _employee_status_cache.clear()
+    await load_editor_ids()
 
 def is_editor(user_id):
-    cur.execute("SELECT is_editor FROM employees WHERE telegram_id = ?", (user_id,))
-    result = cur.fetchone()
-    return result and result[0] == 1
+    return user_id in editor_ids
 
 # Define commands that editors can also use (subset of admin commands)
 # These are commands where editor access is granted via the `has_editor_permission` function
-EDITOR_ALLOWED_ADMIN_COMMANDS = [
+EDITOR_ALLOWED_ADMIN_COMMANDS = frozenset({
     "list_employees", # Already handled by is_admin or is_editor check directly in handler
     "click_user_list",
     "report", # Adding report for editors
@@ -194,7 +493,7 @@ EDITOR_ALLOWED_ADMIN_COMMANDS = [
     "channel_list", # Editors can see public lists
     "earning_bot_list", # Editors can see public lists
     "site_list" # Editors can see public lists
-]
+})
 
 def has_editor_permission(user_id, command_name):
     if not is_editor(user_id):
@@ -203,163 +502,216 @@ def has_editor_permission(user_id, command_name):
     # The command_name from message.text will be like "click_user_list"
     return command_name in EDITOR_ALLOWED_ADMIN_COMMANDS
 
+# Permission filters for the privileged commands: a handler only runs once its filter passes, and
+# unprivileged users are answered by the refusal handlers registered after all commands
+class AdminFilter(BaseFilter):
+    async def __call__(self, message: types.Message) -> bool:
+        return is_admin(message.from_user.id)
+
+class EditorFilter(BaseFilter):
+    def __init__(self, command_name):
+        self.command_name = command_name
+
+    async def __call__(self, message: types.Message) -> bool:
+        return is_admin(message.from_user.id) or has_editor_permission(message.from_user.id, self.command_name)
+
+ADMIN_ONLY_COMMANDS = ("add_channel", "add_bot", "ad_cmd", "add_employee", "delete_employee", "band_employee",
+                       "add_editor", "remove_editor", "set_usdt", "em_visit_add", "em_visit_minus", "convert_visits_to_usdt")
+EDITOR_COMMANDS = ("list_employees", "click_user_list", "report")
+
 
 # --- Telegram Bot Command Handlers ---
 
 # START Command - Improved Welcome Message & Public Commands
+WELCOME_TEXT = (
+    "👋 <b>স্বাগতম!</b> এই বট আপনাকে অনলাইনে আয় করার চমৎকার সুযোগ করে দেবে। সহজ টাস্ক সম্পূর্ণ করে আপনি সহজেই USDT উপার্জন করতে পারবেন!\n\n"
+    "Hello! This bot offers you an excellent opportunity to earn online. Complete simple tasks and easily earn USDT!\n\n"
+)
+BANNED_WELCOME_TEXT = WELCOME_TEXT + "🚫 দুঃখিত, আপনি এই বট থেকে নিষিদ্ধ (banned) হয়েছেন। আপনি কোনো কার্যক্রম করতে পারবেন না।"
+GENERAL_COMMANDS_TEXT = (
+    "🌐 <b>সাধারণ কমান্ডসমূহ:</b>\n"
+    "/bot_info - এই বট সম্পর্কে জানুন\n"
+    "/help_group - সাহায্য পেতে গ্রুপে যোগ দিন\n"
+    "/contact - আমাদের সাথে যোগাযোগ করুন\n"
+    "/channel_list - আমাদের চ্যানেলগুলো দেখুন\n"
+    "/earning_bot_list - আয়ের অন্যান্য বট দেখুন\n"
+    "/site_list - আমাদের ওয়েবসাইটগুলো দেখুন\n"
+    "/em_cmd - এমপ্লয়ি কমান্ড তালিকা (যদি আপনি এমপ্লয়ি হন)\n"
+)
+# The /start reply for each kind of user, put together once
+EMPLOYEE_WELCOME_TEXT = WELCOME_TEXT + "আপনার বর্তমান স্ট্যাটাস: <b>এমপ্লয়ি</b>\n\n" + GENERAL_COMMANDS_TEXT
+PROFILE_MISSING_WELCOME_TEXT = (WELCOME_TEXT + "আপনার বর্তমান স্ট্যাটাস: <b>এমপ্লয়ি</b>\n\n"
+                                "⚠️ আপনার প্রোফাইল সেট করা নেই। দয়া করে `/set_profile` কমান্ড ব্যবহার করে আপনার প্রোফাইল সেট করুন।")
+GUEST_WELCOME_TEXT = (WELCOME_TEXT + "আপনি কি আমাদের সাথে কাজ করে আয় করতে চান? `/join_employee` কমান্ড ব্যবহার করে একজন এমপ্লয়ি হিসেবে যুক্ত হন!\n\n"
+                      + GENERAL_COMMANDS_TEXT)
+
 @dp.message(CommandStart())
 async def send_welcome(message: types.Message, state: FSMContext):
     user_username = message.from_user.username
     user_id = message.from_user.id
 
-    welcome_message = (
-        "👋 <b>স্বাগতম!</b> এই বট আপনাকে অনলাইনে আয় করার চমৎকার সুযোগ করে দেবে। সহজ টাস্ক সম্পূর্ণ করে আপনি সহজেই USDT উপার্জন করতে পারবেন!\n\n"
-        "Hello! This bot offers you an excellent opportunity to earn online. Complete simple tasks and easily earn USDT!\n\n"
-    )
-    
     # Check if user is an employee
-    cur.execute("SELECT profile_set, banned FROM employees WHERE username = ? OR telegram_id = ?", (user_username, user_id))
-    employee_status = cur.fetchone()
-
-    is_already_employee = False
-    profile_is_set = False
-    is_banned = False
-
-    if employee_status:
-        is_already_employee = True
-        profile_is_set = employee_status[0]
-        is_banned = employee_status[1]
-
-    if is_banned:
-        welcome_message += "🚫 দুঃখিত, আপনি এই বট থেকে নিষিদ্ধ (banned) হয়েছেন। আপনি কোনো কার্যক্রম করতে পারবেন না।"
-        await message.reply(welcome_message, parse_mode=ParseMode.HTML)
+    entry = cache_get(_employee_status_cache, (user_id, user_username))
+    if entry:
+        employee_status = entry[1]
+    else:
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT profile_set, banned FROM employees WHERE username = ? OR telegram_id = ?", (user_username, user_id))
+            employee_status = await cur.fetchone()
+        cache_set(_employee_status_cache, (user_id, user_username), employee_status)
+
+    # Banned users get a fixed reply before any of the welcome text is built
+    if employee_status and employee_status[1]:
+        return await message.reply(BANNED_WELCOME_TEXT, parse_mode=ParseMode.HTML)
+
+    if employee_status is None:
+        return await message.reply(GUEST_WELCOME_TEXT, parse_mode=ParseMode.HTML)
+
+    if not employee_status[0]:
+        # Start profile setup FSM if not set
+        await message.reply(PROFILE_MISSING_WELCOME_TEXT, parse_mode=ParseMode.HTML)
+        await state.set_state(ProfileSetup.name)
+        await message.answer("আপনার <b>পুরো নাম</b> লিখুন:") # Initial prompt for profile setup
         return
 
-    if is_already_employee:
-        welcome_message += "আপনার বর্তমান স্ট্যাটাস: <b>এমপ্লয়ি</b>\n\n"
-        if not profile_is_set:
-            welcome_message += "⚠️ আপনার প্রোফাইল সেট করা নেই। দয়া করে `/set_profile` কমান্ড ব্যবহার করে আপনার প্রোফাইল সেট করুন।"
-            # Start profile setup FSM if not set
-            await state.set_state(ProfileSetup.name)
-            await message.answer("আপনার <b>পুরো নাম</b> লিখুন:") # Initial prompt for profile setup
-            return # Exit early to proceed with FSM
-    else:
-        welcome_message += "আপনি কি আমাদের সাথে কাজ করে আয় করতে চান? `/join_employee` কমান্ড ব্যবহার করে একজন এমপ্লয়ি হিসেবে যুক্ত হন!\n\n"
-        
-    welcome_message += (
-        "🌐 <b>সাধারণ কমান্ডসমূহ:</b>\n"
-        "/bot_info - এই বট সম্পর্কে জানুন\n"
-        "/help_group - সাহায্য পেতে গ্রুপে যোগ দিন\n"
-        "/contact - আমাদের সাথে যোগাযোগ করুন\n"
-        "/channel_list - আমাদের চ্যানেলগুলো দেখুন\n"
-        "/earning_bot_list - আয়ের অন্যান্য বট দেখুন\n"
-        "/site_list - আমাদের ওয়েবসাইটগুলো দেখুন\n"
-        "/em_cmd - এমপ্লয়ি কমান্ড তালিকা (যদি আপনি এমপ্লয়ি হন)\n"
-    )
-    await message.reply(welcome_message, parse_mode=ParseMode.HTML)
+    await message.reply(EMPLOYEE_WELCOME_TEXT, parse_mode=ParseMode.HTML)
 
 
 # --- Public Commands (already has is_editor_permission for list, channel_list, earning_bot_list, site_list) ---
+# Static reply texts are built once at import
+BOT_INFO_TEXT = (
+    "🤖 <b>আলুমিন্ট টাস্ক বট - আপনার আয়ের সঙ্গী!</b>\n\n"
+    "এই বটটি আপনাকে বিভিন্ন অনলাইন টাস্ক (যেমন ওয়েবসাইট ভিজিট, ভিডিও দেখা) সম্পন্ন করার মাধ্যমে সহজ উপায়ে USDT উপার্জন করার সুযোগ দেয়। আমাদের এমপ্লয়ি হিসেবে যোগ দিয়ে আপনি আপনার রেফারেল লিংকের মাধ্যমে ভিজিটর এনে আয় করতে পারবেন। এখানে আপনি আপনার কাজের অগ্রগতি, আয় এবং পেমেন্টের তথ্য ট্র্যাক করতে পারবেন।\n\n"
+    "<b>English:</b>\n"
+    "🤖 <b>Alumint Task Bot - Your Earning Companion!</b>\n\n"
+    "This bot provides you with an easy way to earn USDT by completing various online tasks (like website visits, watching videos). By joining as our employee, you can earn by bringing visitors through your referral links. Here, you can track your work progress, earnings, and payment information."
+)
+
+HELP_GROUP_TEXT = 'Need help? Join our support group here: <a href="https://t.me/zflixcogroup">ZflixCO Group</a>'
+CONTACT_TEXT = "For business inquiries or direct support, contact us: @zflix_contract"
+
 @dp.message(Command("bot_info"))
 async def bot_info_handler(message: types.Message):
-    info_text = (
-        "🤖 <b>আলুমিন্ট টাস্ক বট - আপনার আয়ের সঙ্গী!</b>\n\n"
-        "এই বটটি আপনাকে বিভিন্ন অনলাইন টাস্ক (যেমন ওয়েবসাইট ভিজিট, ভিডিও দেখা) সম্পন্ন করার মাধ্যমে সহজ উপায়ে USDT উপার্জন করার সুযোগ দেয়। আমাদের এমপ্লয়ি হিসেবে যোগ দিয়ে আপনি আপনার রেফারেল লিংকের মাধ্যমে ভিজিটর এনে আয় করতে পারবেন। এখানে আপনি আপনার কাজের অগ্রগতি, আয় এবং পেমেন্টের তথ্য ট্র্যাক করতে পারবেন।\n\n"
-        "<b>English:</b>\n"
-        "🤖 <b>Alumint Task Bot - Your Earning Companion!</b>\n\n"
-        "This bot provides you with an easy way to earn USDT by completing various online tasks (like website visits, watching videos). By joining as our employee, you can earn by bringing visitors through your referral links. Here, you can track your work progress, earnings, and payment information."
-    )
-    await message.reply(info_text, parse_mode=ParseMode.HTML)
+    await message.reply(BOT_INFO_TEXT, parse_mode=ParseMode.HTML)
 
 @dp.message(Command("help_group"))
 async def help_group_handler(message: types.Message):
-    await message.reply("Need help? Join our support group here: [ZflixCO Group](https://t.me/zflixcogroup)", parse_mode=ParseMode.HTML)
+    await message.reply(HELP_GROUP_TEXT, parse_mode=ParseMode.HTML)
 
 @dp.message(Command("contact"))
 async def contact_handler(message: types.Message):
-    await message.reply("For business inquiries or direct support, contact us: @zflix_contract", parse_mode=ParseMode.HTML)
+    await message.reply(CONTACT_TEXT, parse_mode=ParseMode.HTML)
+
+# The public lists are sent as HTML, so admin-entered names, descriptions and links are escaped and links are <a> tags
+def list_link(url, label):
+    return f'<a href="{html_decoration.quote(url or "")}">{label}</a>'
 
 @dp.message(Command("channel_list"))
 async def channel_list_handler(message: types.Message):
     # Publicly accessible, but also included in editor permission list for clarity in has_editor_permission
-    cur.execute("SELECT name, description, link FROM channels")
-    channels = cur.fetchall()
-    if not channels:
+    entry = cache_get(_list_cache, "channel_list")
+    if entry:
+        channel_text = entry[1]
+    else:
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT name, description, link FROM channels")
+            channels = await cur.fetchall()
+        channel_text = None
+        if channels:
+            channel_text = "📢 <b>আমাদের চ্যানেলসমূহ:</b>\n\n" + "".join(
+                f"{hbold(name)}\n{html_decoration.quote(desc or '')}\n{list_link(link, 'Join Channel')}\n\n" for name, desc, link in channels)
+        cache_set(_list_cache, "channel_list", channel_text, LIST_CACHE_TTL)
+    if not channel_text:
         return await message.reply("ℹ️ কোনো চ্যানেল যুক্ত করা হয়নি।")
-    
-    channel_text = "📢 <b>আমাদের চ্যানেলসমূহ:</b>\n\n"
-    for name, desc, link in channels:
-        channel_text += f"<b>{name}</b>\n{desc}\n[Join Channel]({link})\n\n"
     await message.reply(channel_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 @dp.message(Command("earning_bot_list"))
 async def earning_bot_list_handler(message: types.Message):
     # Publicly accessible, but also included in editor permission list for clarity in has_editor_permission
-    cur.execute("SELECT name, description, link FROM earning_bots")
-    bots = cur.fetchall()
-    if not bots:
+    entry = cache_get(_list_cache, "earning_bot_list")
+    if entry:
+        bot_text = entry[1]
+    else:
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT name, description, link FROM earning_bots")
+            bots = await cur.fetchall()
+        bot_text = None
+        if bots:
+            bot_text = "💰 <b>আয়ের অন্যান্য বট:</b>\n\n" + "".join(
+                f"{hbold(name)}\n{html_decoration.quote(desc or '')}\n{list_link(link, 'Start Bot')}\n\n" for name, desc, link in bots)
+        cache_set(_list_cache, "earning_bot_list", bot_text, LIST_CACHE_TTL)
+    if not bot_text:
         return await message.reply("ℹ️ কোনো আয়ের বট যুক্ত করা হয়নি।")
-    
-    bot_text = "💰 <b>আয়ের অন্যান্য বট:</b>\n\n"
-    for name, desc, link in bots:
-        bot_text += f"<b>{name}</b>\n{desc}\n[Start Bot]({link})\n\n"
     await message.reply(bot_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 @dp.message(Command("site_list"))
 async def site_list_handler(message: types.Message):
     # Publicly accessible, but also included in editor permission list for clarity in has_editor_permission
-    cur.execute("SELECT name, base_url FROM domains")
-    domains = cur.fetchall()
-    if not domains:
+    # No command writes domains, so this entry only ever expires by TTL
+    entry = cache_get(_list_cache, "site_list")
+    if entry:
+        site_text = entry[1]
+    else:
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT name, base_url FROM domains")
+            domains = await cur.fetchall()
+        site_text = None
+        if domains:
+            site_text = "🌐 <b>আমাদের ওয়েবসাইটসমূহ:</b>\n\n" + "".join(
+                f"{hbold(name)}\n{list_link(url, 'ভিজিট করুন')}\n\n" for name, url in domains)
+        cache_set(_list_cache, "site_list", site_text, LIST_CACHE_TTL)
+    if not site_text:
         return await message.reply("ℹ️ কোনো ওয়েবসাইট যুক্ত করা হয়নি।")
-    
-    site_text = "🌐 <b>আমাদের ওয়েবসাইটসমূহ:</b>\n\n"
-    for name, url in domains:
-        site_text += f"<b>{name}</b>\n[ভিজিট করুন]({url})\n\n"
     await message.reply(site_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 
 # --- Admin Commands for Public Lists ---
-@dp.message(Command("add_channel"))
-async def add_channel_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+# One entry per line; the "Channel"/"Bot" word before each label is optional
+ADD_CHANNEL_RE = re.compile(r"Name:\s*(?P<name>.+?)\s+(?:Channel\s+)?Description:\s*(?P<desc>.+?)\s+(?:Channel\s+)?Link:\s*(?P<link>\S+)")
+ADD_BOT_RE = re.compile(r"Name:\s*(?P<name>.+?)\s+(?:Bot\s+)?Description:\s*(?P<desc>.+?)\s+(?:Bot\s+)?Link:\s*(?P<link>\S+)")
+
+def parse_list_entries(pattern, args):
+    lines = [line for line in (args or "").splitlines() if line.strip()]
+    matches = [pattern.search(line) for line in lines]
+    if not matches or not all(matches):
+        return None
+    return [(m["name"].strip(), m["desc"].strip(), m["link"]) for m in matches]
+
+@dp.message(Command("add_channel"), AdminFilter())
+async def add_channel_handler(message: types.Message, command: CommandObject):
+    entries = parse_list_entries(ADD_CHANNEL_RE, command.args)
+    if not entries:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_channel Channel Name: &lt;name&gt; Channel Description: &lt;desc&gt; Channel Link: &lt;link&gt; (একাধিক চ্যানেলের জন্য প্রতি লাইনে একটি)")
     try:
-        parts = message.text.split(" ", 3) # /add_channel Name: Desc: Link:
-        if len(parts) < 4 or not all(p.endswith(":") for p in parts[1:3]):
-            return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_channel Channel Name: <name> Channel Description: <desc> Channel Link: <link>")
-        
-        # Simple parsing for now, could be more robust
-        channel_name = parts[1].replace("Name:", "").strip()
-        channel_desc = parts[2].replace("Description:", "").strip()
-        channel_link = parts[3].replace("Link:", "").strip()
-
-        cur.execute("INSERT INTO channels (name, description, link) VALUES (?, ?, ?)", (channel_name, channel_desc, channel_link))
-        conn.commit()
-        await message.reply(f"✅ চ্যানেল '{channel_name}' সফলভাবে যুক্ত করা হলো।")
-    except sqlite3.IntegrityError:
-        await message.reply(f"⚠️ এই চ্যানেলটি ইতিমধ্যেই বিদ্যমান।")
+        async with write_transaction():
+            cur = await db.executemany("INSERT OR IGNORE INTO channels (name, description, link) VALUES (?, ?, ?)", entries)
+        _list_cache.pop("channel_list", None)
+        if len(entries) == 1:
+            if cur.rowcount > 0:
+                await message.reply(f"✅ চ্যানেল '{entries[0][0]}' সফলভাবে যুক্ত করা হলো।")
+            else:
+                await message.reply(f"⚠️ এই চ্যানেলটি ইতিমধ্যেই বিদ্যমান।")
+        else:
+            await message.reply(f"✅ {cur.rowcount}টি চ্যানেল যুক্ত করা হলো, {len(entries) - cur.rowcount}টি ইতিমধ্যেই বিদ্যমান।")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("add_bot"))
-async def add_earning_bot_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+@dp.message(Command("add_bot"), AdminFilter())
+async def add_earning_bot_handler(message: types.Message, command: CommandObject):
+    entries = parse_list_entries(ADD_BOT_RE, command.args)
+    if not entries:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_bot Bot Name: &lt;name&gt; Bot Description: &lt;desc&gt; Bot Link: &lt;link&gt; (একাধিক বটের জন্য প্রতি লাইনে একটি)")
     try:
-        parts = message.text.split(" ", 3) # /add_bot Name: Desc: Link:
-        if len(parts) < 4 or not all(p.endswith(":") for p in parts[1:3]):
-            return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_bot Bot Name: <name> Bot Description: <desc> Bot Link: <link>")
-        
-        bot_name = parts[1].replace("Name:", "").strip()
-        bot_desc = parts[2].replace("Description:", "").strip()
-        bot_link = parts[3].replace("Link:", "").strip()
-
-        cur.execute("INSERT INTO earning_bots (name, description, link) VALUES (?, ?, ?)", (bot_name, bot_desc, bot_link))
-        conn.commit()
-        await message.reply(f"✅ বট '{bot_name}' সফলভাবে যুক্ত করা হলো।")
-    except sqlite3.IntegrityError:
-        await message.reply(f"⚠️ এই বটটি ইতিমধ্যেই বিদ্যমান।")
+        async with write_transaction():
+            cur = await db.executemany("INSERT OR IGNORE INTO earning_bots (name, description, link) VALUES (?, ?, ?)", entries)
+        _list_cache.pop("earning_bot_list", None)
+        if len(entries) == 1:
+            if cur.rowcount > 0:
+                await message.reply(f"✅ বট '{entries[0][0]}' সফলভাবে যুক্ত করা হলো।")
+            else:
+                await message.reply(f"⚠️ এই বটটি ইতিমধ্যেই বিদ্যমান।")
+        else:
+            await message.reply(f"✅ {cur.rowcount}টি বট যুক্ত করা হলো, {len(entries) - cur.rowcount}টি ইতিমধ্যেই বিদ্যমান।")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
@@ -372,18 +724,23 @@ async def self_join_employee_handler(message: types.Message, state: FSMContext):
     if not username:
         return await message.reply("❌ আপনার টেলিগ্রাম ইউজারনেম সেট করা নেই। দয়া করে সেটিংস থেকে সেট করুন।")
     
-    cur.execute("SELECT username, banned FROM employees WHERE username = ? OR telegram_id = ?", (username, telegram_id))
-    employee_data = cur.fetchone()
-
-    if employee_data:
-        if employee_data[1]: # Check if banned
+    # Add to employees table with profile_set = 0 and banned = 0. The insert itself is the existence check:
+    # it is skipped when the username or Telegram ID is already registered, and only then is the row read
+    async with write_transaction():
+        cur = await db.execute("INSERT INTO employees (username, telegram_id, profile_set, banned) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+                               (username, telegram_id, 0, 0))
+    if cur.rowcount == 0:
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT banned FROM employees WHERE username = ? OR telegram_id = ?", (username, telegram_id))
+            employee_data = await cur.fetchone()
+        if employee_data and employee_data[0]: # Check if banned
             return await message.reply("🚫 দুঃখিত, আপনি এই বট থেকে নিষিদ্ধ (banned) হয়েছেন। আপনি যুক্ত হতে পারবেন না।")
         else:
             return await message.reply("ℹ️ আপনি ইতিমধ্যেই একজন এমপ্লয়ি হিসেবে নিবন্ধিত আছেন।")
-    
-    # Add to employees table with profile_set = 0 and banned = 0
-    cur.execute("INSERT INTO employees (username, telegram_id, profile_set, banned) VALUES (?, ?, ?, ?)", (username, telegram_id, 0, 0))
-    conn.commit()
+
+    employees_cache.add(username)
+    await invalidate_employee_caches()
+    invalidate_report()
     await message.reply(f"✅ @{username} আপনাকে এমপ্লয়ি হিসেবে যুক্ত করা হলো! এখন আপনার প্রোফাইল সেট করার পালা।")
     
     # Start profile setup FSM
@@ -393,11 +750,71 @@ async def self_join_employee_handler(message: types.Message, state: FSMContext):
 
 # --- Profile Management (FSM) ---
 
+# Writes a complete profile; `fields` holds a value for every column named in PROFILE_BULK_FIELDS
+async def save_profile(username, fields):
+    async with write_transaction():
+        await db.execute("""
+            UPDATE employees SET
+            profile_set = ?, full_name = ?, phone_number = ?, email = ?,
+            bkash_number = ?, binance_id = ?, youtube_link = ?,
+            facebook_link = ?, tiktok_link = ?, website_link = ?,
+            about_yourself = ?
+            WHERE username = ?
+        """, (
+            1, fields['full_name'], fields['phone_number'], fields['email'],
+            fields['bkash_number'], fields['binance_id'], fields['youtube_link'],
+            fields['facebook_link'], fields['tiktok_link'], fields['website_link'],
+            fields['about_yourself'], username
+        ))
+    await invalidate_employee_caches()
+
+# /set_profile_bulk takes the whole profile in one message, one "Label: value" per line
+PROFILE_BULK_FIELDS = {
+    "name": "full_name",
+    "phone": "phone_number",
+    "email": "email",
+    "bkash": "bkash_number",
+    "binance": "binance_id",
+    "youtube": "youtube_link",
+    "facebook": "facebook_link",
+    "tiktok": "tiktok_link",
+    "website": "website_link",
+    "about": "about_yourself",
+}
+PROFILE_BULK_USAGE = (
+    "⚠️ সব তথ্য এক মেসেজে, প্রতি লাইনে একটি করে লিখুন:\n"
+    "<code>/set_profile_bulk\n"
+    "Name: ...\nPhone: ...\nEmail: ...\nBkash: ...\nBinance: ...\n"
+    "Youtube: ...\nFacebook: ...\nTikTok: ...\nWebsite: ...\nAbout: ...</code>"
+)
+
+@dp.message(Command("set_profile_bulk"))
+async def set_profile_bulk_handler(message: types.Message, command: CommandObject, state: FSMContext):
+    username = message.from_user.username
+    if username not in employees_cache:
+        return await message.reply("❌ আপনি এমপ্লয়ি নন।`/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
+
+    fields = {}
+    for line in (command.args or "").splitlines():
+        label, sep, value = line.partition(":")
+        column = PROFILE_BULK_FIELDS.get(label.strip().lower())
+        if sep and column and value.strip():
+            fields[column] = value.strip()
+    if len(fields) < len(PROFILE_BULK_FIELDS):
+        return await message.reply(PROFILE_BULK_USAGE, parse_mode=ParseMode.HTML)
+
+    try:
+        await save_profile(username, fields)
+        # A step-by-step /set_profile left half-way is superseded by this one
+        await state.clear()
+        await message.reply("✅ আপনার প্রোফাইল সফলভাবে সেট/আপডেট করা হয়েছে!")
+    except Exception as e:
+        await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
+
 @dp.message(Command("set_profile", "change_profile"))
 async def start_profile_setup(message: types.Message, state: FSMContext):
     username = message.from_user.username
-    cur.execute("SELECT username FROM employees WHERE username = ?", (username,))
-    if not cur.fetchone():
+    if username not in employees_cache:
         return await message.reply("❌ আপনি এমপ্লয়ি নন।`/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
     
     await state.set_state(ProfileSetup.name)
@@ -454,318 +871,385 @@ async def process_tiktok(message: types.Message, state: FSMContext):
 @dp.message(ProfileSetup.website)
 async def process_website(message: types.Message, state: FSMContext):
     await state.update_data(website_link=message.text)
-    
-    user_data = await state.get_data()
-    username = message.from_user.username
+    await message.answer("আপনার <b>নিজের সম্পর্কে</b> সংক্ষেপে লিখুন:")
+    await state.set_state(ProfileSetup.about_yourself)
 
-    cur.execute("""
-        UPDATE employees SET
-        profile_set = ?, full_name = ?, phone_number = ?, email = ?,
-        bkash_number = ?, binance_id = ?, youtube_link = ?,
-        facebook_link = ?, tiktok_link = ?, website_link = ?,
-        about_yourself = ?
-        WHERE username = ?
-    """, (
-        1, user_data['full_name'], user_data['phone_number'], user_data['email'],
-        user_data['bkash_number'], user_data['binance_id'], user_data['youtube_link'],
-        user_data['facebook_link'], user_data['tiktok_link'], user_data['website_link'],
-        user_data['about_yourself'], username
-    ))
-    conn.commit()
+# The answers only live in FSM data until the last step, which saves the whole profile in one UPDATE and one commit
+@dp.message(ProfileSetup.about_yourself)
+async def process_about_yourself(message: types.Message, state: FSMContext):
+    await state.update_data(about_yourself=message.text)
+    
+    await save_profile(message.from_user.username, await state.get_data())
     
     await message.reply("✅ আপনার প্রোফাইল সফলভাবে সেট/আপডেট করা হয়েছে!")
     await state.clear()
 
+PROFILE_TEMPLATE = (
+    "👤 <b>আপনার প্রোফাইল:</b>\n\n"
+    "<b>নাম:</b> {full_name}\n"
+    "<b>ফোন:</b> {phone_number}\n"
+    "<b>ইমেইল:</b> {email}\n"
+    "<b>বিকাশ নম্বর:</b> {bkash_number}\n"
+    "<b>Binance ID:</b> {binance_id}\n"
+    "<b>Youtube:</b> {youtube_link}\n"
+    "<b>Facebook:</b> {facebook_link}\n"
+    "<b>TikTok:</b> {tiktok_link}\n"
+    "<b>Website:</b> {website_link}\n"
+    "<b>About:</b> {about_yourself}\n\n"
+    "প্রোফাইল পরিবর্তন করতে: `/change_profile`"
+)
+
 @dp.message(Command("my_profile"))
 async def my_profile_handler(message: types.Message):
     username = message.from_user.username
     if not username:
         return await message.reply("❌ আপনার টেলিগ্রাম ইউজারনেম সেট করা নেই।")
     
-    cur.execute("""
-        SELECT full_name, phone_number, email, bkash_number, binance_id,
-               youtube_link, facebook_link, tiktok_link, website_link, about_yourself,
-               profile_set
-        FROM employees WHERE username = ?
-    """, (username,))
-    profile_data = cur.fetchone()
+    async with reader() as rdb:
+        cur = await rdb.execute("""
+            SELECT full_name, phone_number, email, bkash_number, binance_id,
+                   youtube_link, facebook_link, tiktok_link, website_link, about_yourself,
+                   profile_set
+            FROM employees WHERE username = ?
+        """, (username,))
+        profile_data = await cur.fetchone()
 
     if not profile_data:
         return await message.reply("❌ আপনি একজন নিবন্ধিত কর্মচারী নন। `/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
     
-    (full_name, phone, email, bkash, binance, youtube, facebook, tiktok, website, about, profile_set) = profile_data
-
-    if not profile_set:
+    if not profile_data[-1]: # profile_set
         return await message.reply("⚠️ আপনার প্রোফাইল সেট করা নেই। `/set_profile` কমান্ড ব্যবহার করে আপনার প্রোফাইল সেট করুন।")
 
-    profile_text = (
-        f"👤 <b>আপনার প্রোফাইল:</b>\n\n"
-        f"<b>নাম:</b> {full_name or 'N/A'}\n"
-        f"<b>ফোন:</b> {phone or 'N/A'}\n"
-        f"<b>ইমেইল:</b> {email or 'N/A'}\n"
-        f"<b>বিকাশ নম্বর:</b> {bkash or 'N/A'}\n"
-        f"<b>Binance ID:</b> {binance or 'N/A'}\n"
-        f"<b>Youtube:</b> {youtube or 'N/A'}\n"
-        f"<b>Facebook:</b> {facebook or 'N/A'}\n"
-        f"<b>TikTok:</b> {tiktok or 'N/A'}\n"
-        f"<b>Website:</b> {website or 'N/A'}\n"
-        f"<b>About:</b> {about or 'N/A'}\n\n"
-        "প্রোফাইল পরিবর্তন করতে: `/change_profile`"
-    )
+    # Every field is user-typed: escaped for HTML, empty ones shown as N/A
+    fields = {column[0]: html_decoration.quote(str(value)) if value else "N/A"
+              for column, value in zip(cur.description, profile_data)}
+    profile_text = PROFILE_TEMPLATE.format_map(fields)
     await message.reply(profile_text, parse_mode=ParseMode.HTML)
 
 
 # --- Employee Commands List (updated) ---
+EMPLOYEE_COMMANDS_TEXT = (
+    "📋 <b>এমপ্লয়ি কমান্ডসমূহ:</b>\n\n"
+    "/start - বটের সাথে কথা বলা শুরু করুন\n"
+    "/em_cmd (বা /my_cmd) - এই কমান্ড তালিকা দেখুন\n"
+    "/get_task - আপনার টাস্ক লিংক পান\n"
+    "/my_views - আপনার রেফারেল ভিউ সংখ্যা দেখুন\n"
+    "/my_profile - আপনার প্রোফাইল তথ্য দেখুন\n"
+    "/set_profile (বা /change_profile) - আপনার প্রোফাইল সেট/পরিবর্তন করুন\n"
+    "/set_profile_bulk - পুরো প্রোফাইল এক মেসেজে সেট করুন\n"
+    "/my_balance - আপনার USDT ব্যালেন্স দেখুন\n"
+    "/claim_usdt - ভিজিট থেকে USDT তে রূপান্তর করুন (নতুন কমান্ড)\n" # <-- নতুন কমান্ড যোগ করা হয়েছে
+    "/withdraw_usdt - ব্যালেন্স উত্তোলন করুন\n"
+)
+
 @dp.message(Command("em_cmd", "my_cmd")) # Added my_cmd as an alias
 async def employee_command_list(message: types.Message):
-    commands_text = (
-        "📋 <b>এমপ্লয়ি কমান্ডসমূহ:</b>\n\n"
-        "/start - বটের সাথে কথা বলা শুরু করুন\n"
-        "/em_cmd (বা /my_cmd) - এই কমান্ড তালিকা দেখুন\n"
-        "/get_task - আপনার টাস্ক লিংক পান\n"
-        "/my_views - আপনার রেফারেল ভিউ সংখ্যা দেখুন\n"
-        "/my_profile - আপনার প্রোফাইল তথ্য দেখুন\n"
-        "/set_profile (বা /change_profile) - আপনার প্রোফাইল সেট/পরিবর্তন করুন\n"
-        "/my_balance - আপনার USDT ব্যালেন্স দেখুন\n"
-        "/claim_usdt - ভিজিট থেকে USDT তে রূপান্তর করুন (নতুন কমান্ড)\n" # <-- নতুন কমান্ড যোগ করা হয়েছে
-        "/withdraw_usdt - ব্যালেন্স উত্তোলন করুন\n"
-    )
-    await message.reply(commands_text, parse_mode=ParseMode.HTML)
+    await message.reply(EMPLOYEE_COMMANDS_TEXT, parse_mode=ParseMode.HTML)
 
 
 # --- Existing Commands (modified) ---
 
 # Admin Commands List (from previous, now with new commands and editor access notes)
-@dp.message(Command("ad_cmd"))
+# The &lt;...&gt; placeholders must stay escaped: the text is sent as HTML
+ADMIN_COMMANDS_TEXT = (
+    "📋 <b>অ্যাডমিন কমান্ডসমূহ:</b>\n\n"
+    "/ad_cmd - এই কমান্ড তালিকা দেখুন\n"
+    "/em_cmd - এমপ্লয়ি কমান্ড তালিকা দেখুন\n"
+    "/add_employee @username &lt;Telegram_ID&gt; - নতুন কর্মচারী যুক্ত করুন (অ্যাডমিন অনুমোদিত, একসাথে একাধিক: @a @b 123 @c)\n"
+    "/delete_employee @username - কর্মচারী মুছে ফেলুন\n"
+    "/list_employees [page] - সকল কর্মচারীর তালিকা দেখুন, পৃষ্ঠা অনুযায়ী (এডিটরদেরও অনুমতি আছে)\n"
+    "/click_user_list - রেফারেল লিংক ক্লিক করা ব্যবহারকারীদের তালিকা দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/band_employee @username - কর্মচারীকে নিষিদ্ধ করুন\n"
+    "/add_editor @username - কর্মচারীকে এডিটর হিসেবে যুক্ত করুন\n"
+    "/remove_editor @username - কর্মচারীকে এডিটর থেকে অপসারণ করুন\n"
+    "/report - টাস্ক এবং ভিউ রিপোর্ট দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/list_domains - সকল ডোমেইন তালিকা দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/channel_list - আমাদের চ্যানেলগুলো দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/earning_bot_list - আয়ের অন্যান্য বট দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/site_list - আমাদের ওয়েবসাইটগুলো দেখুন (এডিটরদেরও অনুমতি আছে)\n"
+    "/add_domain &lt;name&gt; &lt;base_url&gt; - নতুন ডোমেইন যোগ করুন\n"
+    "/delete_domain &lt;name&gt; - ডোমেইন মুছে ফেলুন\n"
+    "/add_channel Channel Name: &lt;name&gt; Channel Description: &lt;desc&gt; Channel Link: &lt;link&gt; - নতুন চ্যানেল যোগ করুন\n"
+    "/add_bot Bot Name: &lt;name&gt; Bot Description: &lt;desc&gt; Bot Link: &lt;link&gt; - নতুন আর্নিং বট যোগ করুন\n"
+    "/set_global_task &lt;domain_name&gt; &lt;task_identifier&gt; - সকল কর্মচারীর জন্য গ্লোবাল টাস্ক সেট করুন\n"
+    "/assign_task @username &lt;domain_name&gt; &lt;task_identifier&gt; - নির্দিষ্ট কর্মচারীকে টাস্ক দিন\n"
+    "/post_all &lt;আপনার_মেসেজ&gt; - সকল কর্মচারীকে মেসেজ পাঠান\n"
+    "/post_to_employee @username &lt;আপনার_মেসেজ&gt; - নির্দিষ্ট কর্মচারীকে মেসেজ পাঠান\n"
+    "/set_usdt &lt;amount&gt; - প্রতি 1000 ভিজিট এর জন্য USDT রেট সেট করুন (যেমন: /set_usdt 1.00)\n"
+    "/em_visit_add @username &lt;visits&gt; - কর্মচারীর ভিজিট যোগ করুন (যেমন: /em_visit_add @user 115)\n"
+    "/em_visit_minus @username &lt;visits&gt; - কর্মচারীর ভিজিট কাটুন (যেমন: /em_visit_minus @user 115)\n"
+    "/convert_visits_to_usdt @username - ভিজিট থেকে USDT তে রূপান্তর করুন (এই কমান্ড অ্যাডমিনদের জন্য থাকবে)\n"
+)
+
+@dp.message(Command("ad_cmd"), AdminFilter())
 async def admin_command_list(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
-    
-    commands_text = (
-        "📋 <b>অ্যাডমিন কমান্ডসমূহ:</b>\n\n"
-        "/ad_cmd - এই কমান্ড তালিকা দেখুন\n"
-        "/em_cmd - এমপ্লয়ি কমান্ড তালিকা দেখুন\n"
-        "/add_employee @username <Telegram_ID> - নতুন কর্মচারী যুক্ত করুন (অ্যাডমিন অনুমোদিত)\n"
-        "/delete_employee @username - কর্মচারী মুছে ফেলুন\n"
-        "/list_employees - সকল কর্মচারীর তালিকা দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/click_user_list - রেফারেল লিংক ক্লিক করা ব্যবহারকারীদের তালিকা দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/band_employee @username - কর্মচারীকে নিষিদ্ধ করুন\n"
-        "/add_editor @username - কর্মচারীকে এডিটর হিসেবে যুক্ত করুন\n"
-        "/remove_editor @username - কর্মচারীকে এডিটর থেকে অপসারণ করুন\n"
-        "/report - টাস্ক এবং ভিউ রিপোর্ট দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/list_domains - সকল ডোমেইন তালিকা দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/channel_list - আমাদের চ্যানেলগুলো দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/earning_bot_list - আয়ের অন্যান্য বট দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/site_list - আমাদের ওয়েবসাইটগুলো দেখুন (এডিটরদেরও অনুমতি আছে)\n"
-        "/add_domain <name> <base_url> - নতুন ডোমেইন যোগ করুন\n"
-        "/delete_domain <name> - ডোমেইন মুছে ফেলুন\n"
-        "/add_channel Channel Name: <name> Channel Description: <desc> Channel Link: <link> - নতুন চ্যানেল যোগ করুন\n"
-        "/add_bot Bot Name: <name> Bot Description: <desc> Bot Link: <link> - নতুন আর্নিং বট যোগ করুন\n"
-        "/set_global_task <domain_name> <task_identifier> - সকল কর্মচারীর জন্য গ্লোবাল টাস্ক সেট করুন\n"
-        "/assign_task @username <domain_name> <task_identifier> - নির্দিষ্ট কর্মচারীকে টাস্ক দিন\n"
-        "/post_all <আপনার_মেসেজ> - সকল কর্মচারীকে মেসেজ পাঠান\n"
-        "/post_to_employee @username <আপনার_মেসেজ> - নির্দিষ্ট কর্মচারীকে মেসেজ পাঠান\n"
-        "/set_usdt <amount> - প্রতি 1000 ভিজিট এর জন্য USDT রেট সেট করুন (যেমন: /set_usdt 1.00)\n"
-        "/em_visit_add @username <visits> - কর্মচারীর ভিজিট যোগ করুন (যেমন: /em_visit_add @user 115)\n"
-        "/em_visit_minus @username <visits> - কর্মচারীর ভিজিট কাটুন (যেমন: /em_visit_minus @user 115)\n"
-        "/convert_visits_to_usdt @username - ভিজিট থেকে USDT তে রূপান্তর করুন (এই কমান্ড অ্যাডমিনদের জন্য থাকবে)\n"
-    )
-    await message.reply(commands_text, parse_mode=ParseMode.HTML)
+    await message.reply(ADMIN_COMMANDS_TEXT, parse_mode=ParseMode.HTML)
 
 
 # Admin Employee Management (already exists, but updated for 'banned' status)
-@dp.message(Command("add_employee"))
+@dp.message(Command("add_employee"), AdminFilter())
 async def admin_add_employee_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!") # Only admin can use this form of add_employee
     try:
         parts = message.text.split()
         if len(parts) < 2:
-            return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_employee @username <Telegram_ID (ঐচ্ছিক)>")
+            return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_employee @username <Telegram_ID (ঐচ্ছিক)> [@username2 <Telegram_ID> ...]")
         
-        username = parts[1].replace('@', '')
-        telegram_id = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
-
-        cur.execute("SELECT banned FROM employees WHERE username = ?", (username,))
-        existing_employee = cur.fetchone()
-
-        if existing_employee:
-            if existing_employee[0]: # If banned, unban them
-                cur.execute("UPDATE employees SET banned = 0, telegram_id = ? WHERE username = ?", (telegram_id, username))
-                conn.commit()
-                await message.reply(f"✅ @{username} (ID: {telegram_id if telegram_id else 'N/A'}) কে সফলভাবে আনব্যান করা হলো এবং এমপ্লয়ি হিসেবে পুনঃযুক্ত করা হলো!")
+        # Several employees can be added at once: /add_employee @a 111 @b @c 333
+        entries = {} # username -> telegram_id, in the order given
+        last_username = None
+        for part in parts[1:]:
+            if part.isdigit() and last_username and entries[last_username] is None:
+                entries[last_username] = int(part)
             else:
-                await message.reply(f"ℹ️ @{username} ইতিমধ্যেই একজন এমপ্লয়ি হিসেবে নিবন্ধিত আছেন।")
-        else:
-            cur.execute("INSERT INTO employees (username, telegram_id, banned) VALUES (?, ?, ?)", (username, telegram_id, 0))
-            conn.commit()
-            await message.reply(f"✅ @{username} (ID: {telegram_id if telegram_id else 'N/A'}) কে এমপ্লয়ি হিসেবে যুক্ত করা হলো!")
-    except (IndexError, ValueError):
-        await message.reply("⚠️ সঠিকভাবে লিখুন: /add_employee @username <Telegram_ID (ঐচ্ছিক)>")
+                last_username = part.replace('@', '')
+                entries[last_username] = None
+
+        # The lookup and the writes share one transaction, so the rows can't change in between;
+        # if any statement fails the whole bulk add is rolled back
+        placeholders = ", ".join("?" * len(entries))
+        async with write_transaction():
+            cur = await db.execute(f"SELECT username, banned FROM employees WHERE username IN ({placeholders})", tuple(entries))
+            existing = dict(await cur.fetchall())
+
+            to_unban = [(telegram_id, username) for username, telegram_id in entries.items() if existing.get(username)]
+            to_insert = [(username, telegram_id, 0) for username, telegram_id in entries.items() if username not in existing]
+            if to_unban:
+                await db.executemany("UPDATE employees SET banned = 0, telegram_id = ? WHERE username = ?", to_unban)
+            if to_insert:
+                await db.executemany("INSERT INTO employees (username, telegram_id, banned) VALUES (?, ?, ?)", to_insert)
+        if to_unban or to_insert:
+            employees_cache.update(username for username, _, _ in to_insert)
+            await invalidate_employee_caches()
+            invalidate_report()
+
+        reply_lines = []
+        for username, telegram_id in entries.items():
+            if username not in existing:
+                reply_lines.append(f"✅ @{username} (ID: {telegram_id if telegram_id else 'N/A'}) কে এমপ্লয়ি হিসেবে যুক্ত করা হলো!")
+            elif existing[username]: # Was banned, now unbanned
+                reply_lines.append(f"✅ @{username} (ID: {telegram_id if telegram_id else 'N/A'}) কে সফলভাবে আনব্যান করা হলো এবং এমপ্লয়ি হিসেবে পুনঃযুক্ত করা হলো!")
+            else:
+                reply_lines.append(f"ℹ️ @{username} ইতিমধ্যেই একজন এমপ্লয়ি হিসেবে নিবন্ধিত আছেন।")
+        await message.reply("\n".join(reply_lines))
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("delete_employee"))
+@dp.message(Command("delete_employee"), AdminFilter())
 async def delete_employee(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
-    try:
-        username = message.text.split()[1].replace('@', '')
-        cur.execute("DELETE FROM employees WHERE username = ?", (username,))
-        cur.execute("DELETE FROM individual_tasks WHERE employee_username = ?", (username,)) # Delete associated tasks
-        conn.commit()
-        if cur.rowcount > 0:
-            await message.reply(f"✅ @{username} কে এমপ্লয়ি তালিকা থেকে মুছে ফেলা হলো এবং তার টাস্কগুলোও ডিলিট করা হলো।")
-        else:
-            await message.reply(f"ℹ️ @{username} নামে কোনো এমপ্লয়ি পাওয়া যায়নি।")
-    except IndexError:
-        await message.reply("⚠️ সঠিকভাবে লিখুন: /delete_employee @username")
+    parts = message.text.split()
+    if len(parts) < 2:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /delete_employee @username")
+    username = parts[1].replace('@', '')
+    async with write_transaction():
+        cur = await db.execute("DELETE FROM employees WHERE username = ?", (username,))
+        await db.execute("DELETE FROM individual_tasks WHERE employee_username = ?", (username,)) # Delete associated tasks
+    employees_cache.discard(username)
+    await invalidate_employee_caches()
+    invalidate_report()
+    if cur.rowcount > 0:
+        await message.reply(f"✅ @{username} কে এমপ্লয়ি তালিকা থেকে মুছে ফেলা হলো এবং তার টাস্কগুলোও ডিলিট করা হলো।")
+    else:
+        await message.reply(f"ℹ️ @{username} নামে কোনো এমপ্লয়ি পাওয়া যায়নি।")
 
-@dp.message(Command("band_employee")) # NEW
+@dp.message(Command("band_employee"), AdminFilter()) # NEW
 async def band_employee_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+    parts = message.text.split()
+    if len(parts) < 2:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /band_employee @username")
+    username = parts[1].replace('@', '')
     try:
-        username = message.text.split()[1].replace('@', '')
-        cur.execute("UPDATE employees SET banned = 1 WHERE username = ?", (username,))
-        conn.commit()
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET banned = 1 WHERE username = ?", (username,))
+        await invalidate_employee_caches()
         if cur.rowcount > 0:
             await message.reply(f"✅ @{username} কে সফলভাবে নিষিদ্ধ (banned) করা হলো। সে আর নিজে থেকে জয়েন করতে পারবে না।")
         else:
             await message.reply(f"ℹ️ @{username} নামে কোনো এমপ্লয়ি পাওয়া যায়নি।")
-    except IndexError:
-        await message.reply("⚠️ সঠিকভাবে লিখুন: /band_employee @username")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("add_editor")) # NEW
+@dp.message(Command("add_editor"), AdminFilter()) # NEW
 async def add_editor_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+    parts = message.text.split()
+    if len(parts) < 2:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /add_editor @username")
+    username = parts[1].replace('@', '')
     try:
-        username = message.text.split()[1].replace('@', '')
-        cur.execute("UPDATE employees SET is_editor = 1 WHERE username = ?", (username,))
-        conn.commit()
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET is_editor = 1 WHERE username = ?", (username,))
+        await invalidate_employee_caches()
         if cur.rowcount > 0:
             await message.reply(f"✅ @{username} কে সফলভাবে এডিটর হিসেবে যুক্ত করা হলো।")
         else:
             await message.reply(f"ℹ️ @{username} নামে কোনো কর্মচারী পাওয়া যায়নি।")
-    except IndexError:
-        await message.reply("⚠️ সঠিকভাবে লিখুন: /add_editor @username")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("remove_editor")) # NEW
+@dp.message(Command("remove_editor"), AdminFilter()) # NEW
 async def remove_editor_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+    parts = message.text.split()
+    if len(parts) < 2:
+        return await message.reply("⚠️ সঠিকভাবে লিখুন: /remove_editor @username")
+    username = parts[1].replace('@', '')
     try:
-        username = message.text.split()[1].replace('@', '')
-        cur.execute("UPDATE employees SET is_editor = 0 WHERE username = ?", (username,))
-        conn.commit()
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET is_editor = 0 WHERE username = ?", (username,))
+        await invalidate_employee_caches()
         if cur.rowcount > 0:
             await message.reply(f"✅ @{username} কে সফলভাবে এডিটর থেকে অপসারণ করা হলো।")
         else:
             await message.reply(f"ℹ️ @{username} নামে কোনো কর্মচারী পাওয়া যায়নি।")
-    except IndexError:
-        await message.reply("⚠️ সঠিকভাবে লিখুন: /remove_editor @username")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("list_employees"))
-async def list_employees(message: types.Message):
-    # Editors (via has_editor_permission) and Admins can use this
-    if not (is_admin(message.from_user.id) or has_editor_permission(message.from_user.id, "list_employees")):
-        return await message.reply("❌ আপনার এই কমান্ড ব্যবহারের অনুমতি নেই!")
-    
-    cur.execute("SELECT username, full_name, total_visits, usdt_balance, banned, is_editor FROM employees")
-    employees = cur.fetchall()
+# /list_employees lists this many employees per page; /list_employees <page> shows the later ones
+EMPLOYEE_LIST_PAGE_SIZE = 50
+
+@dp.message(Command("list_employees"), EditorFilter("list_employees"))
+async def list_employees(message: types.Message, command: CommandObject):
+    page = int(command.args) if command.args and command.args.strip().isdecimal() else 1
+    page = max(page, 1)
+    async with reader() as rdb:
+        # One row past the page tells whether there is a next page
+        cur = await rdb.execute("SELECT username, full_name, total_visits, usdt_balance, banned, is_editor FROM employees ORDER BY username LIMIT ? OFFSET ?",
+                                (EMPLOYEE_LIST_PAGE_SIZE + 1, (page - 1) * EMPLOYEE_LIST_PAGE_SIZE))
+        employees = await cur.fetchall()
     if not employees:
-        return await message.reply("ℹ️ কোনো এমপ্লয়ি পাওয়া যায়নি।")
+        if page > 1:
+            return await message.reply(f"ℹ️ পৃষ্ঠা {page} এ কোনো এমপ্লয়ি নেই।")
+        return await message.reply("ℹ️ কোনো এমপ্লয়ি পাওয়া যায়নি।")
+    has_next_page = len(employees) > EMPLOYEE_LIST_PAGE_SIZE
+    employees = employees[:EMPLOYEE_LIST_PAGE_SIZE]
     
-    employee_list_text = "👥 <b>এমপ্লয়িদের তালিকা:</b>\n\n"
-    for emp_username, emp_full_name, total_visits, usdt_balance, banned_status, is_editor_status in employees:
-        status_text = ""
-        if banned_status:
-            status_text += "🚫 Banned"
-        if is_editor_status:
-            status_text += " ✨ Editor"
-        
-        employee_list_text += (
-            f"<b>@{emp_username}</b> ({emp_full_name or 'N/A'}) {status_text.strip()}\n"
-            f"  👁️ ভিজিট: {total_visits}, 💰 ব্যালেন্স: {usdt_balance:.2f} USDT\n"
-        )
-    await message.reply(employee_list_text, parse_mode=ParseMode.HTML)
+    # Status labels for every (banned, is_editor) combination, so the loop only does lookups
+    status_labels = {(False, False): "", (True, False): "🚫 Banned", (False, True): "✨ Editor", (True, True): "🚫 Banned ✨ Editor"}
+    page_label = f" (পৃষ্ঠা {page})" if page > 1 or has_next_page else ""
+    parts = [f"👥 <b>এমপ্লয়িদের তালিকা{page_label}:</b>\n\n"]
+    parts.extend(
+        f"<b>@{emp_username}</b> ({emp_full_name or 'N/A'}) {status_labels[(bool(banned_status), bool(is_editor_status))]}\n"
+        f"  👁️ ভিজিট: {total_visits}, 💰 ব্যালেন্স: {usdt_balance:.2f} USDT\n"
+        for emp_username, emp_full_name, total_visits, usdt_balance, banned_status, is_editor_status in employees
+    )
+    if has_next_page:
+        parts.append(f"\n➡️ পরের পৃষ্ঠা: /list_employees {page + 1}")
+    for i, chunk in enumerate(split_message("".join(parts))):
+        if i:
+            await asyncio.sleep(1 / 28) # Stay under Telegram's per-bot send rate
+        await message.reply(chunk, parse_mode=ParseMode.HTML)
+
+# Caps /click_user_list so the reply stays well under Telegram's 4096 character limit
+CLICK_USER_LIST_LIMIT = 50
 
-@dp.message(Command("click_user_list")) # NEW - now also for editors
+@dp.message(Command("click_user_list"), EditorFilter("click_user_list")) # NEW - now also for editors
 async def click_user_list_handler(message: types.Message):
-    # Editors (via has_editor_permission) and Admins can use this
-    if not (is_admin(message.from_user.id) or has_editor_permission(message.from_user.id, "click_user_list")):
-        return await message.reply("❌ আপনি অ্যাডমিন নন বা এই কমান্ড ব্যবহারের অনুমতি নেই!")
-    
-    # Select distinct viewer_username and viewer_full_name from clicks
+    # Distinct viewers come from click_viewers (one row each, kept up to date by a trigger on clicks)
     # Exclude those who are also employees
-    cur.execute("""
-        SELECT DISTINCT c.viewer_username, c.viewer_full_name, c.viewer_telegram_id
-        FROM clicks c
-        LEFT JOIN employees e ON c.viewer_username = e.username OR c.viewer_telegram_id = e.telegram_id
-        WHERE e.username IS NULL
-    """)
-    clicked_users = cur.fetchall()
+    # Only the most recent viewers are listed; the window column carries the total distinct count
+    async with reader() as rdb:
+        cur = await rdb.execute("""
+            SELECT v.viewer_username, v.viewer_full_name, v.viewer_telegram_id, COUNT(*) OVER ()
+            FROM click_viewers v
+            WHERE NOT EXISTS (SELECT 1 FROM employees e WHERE e.username = v.viewer_username)
+              AND NOT EXISTS (SELECT 1 FROM employees e WHERE e.telegram_id = v.viewer_telegram_id)
+            ORDER BY v.last_click_id DESC
+            LIMIT ?
+        """, (CLICK_USER_LIST_LIMIT,))
+        clicked_users = await cur.fetchall()
 
     if not clicked_users:
         return await message.reply("ℹ️ কোনো নন-এমপ্লয়ি ব্যবহারকারী রেফারেল লিংকে ক্লিক করেনি।")
     
-    user_list_text = "👤 <b>রেফারেল লিংক ক্লিক করা ব্যবহারকারী (নন-এমপ্লয়ি):</b>\n\n"
-    for username, full_name, telegram_id in clicked_users:
-        user_list_text += f"• <b>{full_name or 'N/A'}</b> (@{username or 'N/A'}) [ID: {telegram_id or 'N/A'}]\n"
-    await message.reply(user_list_text, parse_mode=ParseMode.HTML)
+    total_users = clicked_users[0][3]
+    parts = [f"👤 <b>রেফারেল লিংক ক্লিক করা ব্যবহারকারী (নন-এমপ্লয়ি): {total_users} জন</b>\n\n"]
+    parts.extend(f"• <b>{full_name or 'N/A'}</b> (@{username or 'N/A'}) [ID: {telegram_id or 'N/A'}]\n"
+                 for username, full_name, telegram_id, _ in clicked_users)
+    if total_users > len(clicked_users):
+        parts.append(f"\n… এবং আরও {total_users - len(clicked_users)} জন (সাম্প্রতিক {len(clicked_users)} জন দেখানো হলো)")
+    await message.reply("".join(parts), parse_mode=ParseMode.HTML)
+
+# The rendered /report is cached and only rebuilt on the first /report after a write
+# that changes it (clicks, visit counts, employees or withdraw requests)
+_report_cache = None
+_report_dirty = True
+_report_data_version = None
+_report_lock = asyncio.Lock()
+
+def invalidate_report():
+    global _report_dirty
+    _report_dirty = True
+
+async def build_report():
+    parts = ["📋 <b>রিপোর্ট:</b>\n\n"]
+
+    # Totals, top employees and pending withdrawals come back from one query as labelled rows:
+    # (section, rank, ...) with section 0 = totals, 1 = top employees, 2 = pending withdrawals
+    async with reader() as rdb:
+        cur = await rdb.execute("""
+            SELECT 0, 0, (SELECT value FROM counters WHERE name = 'clicks'), (SELECT value FROM counters WHERE name = 'visits'), NULL, NULL, NULL
+            UNION ALL
+            SELECT * FROM (SELECT 1, ROW_NUMBER() OVER (ORDER BY total_visits DESC), username, total_visits, NULL, NULL, NULL
+                           FROM employees ORDER BY total_visits DESC LIMIT 5)
+            UNION ALL
+            SELECT * FROM (SELECT 2, ROW_NUMBER() OVER (ORDER BY request_date DESC),
+                                  employee_username, usdt_amount, payment_method, payment_detail, request_date
+                           FROM withdraw_requests WHERE status = 'pending' ORDER BY request_date DESC LIMIT 5)
+            ORDER BY 1, 2
+        """)
+        rows = await cur.fetchall()
+    total_clicks, total_visits = rows[0][2], rows[0][3]
+    top_employees = [row[2:4] for row in rows if row[0] == 1]
+    pending_withdraws = [row[2:] for row in rows if row[0] == 2]
 
-@dp.message(Command("report")) # Now also for editors
-async def get_report(message: types.Message):
-    if not (is_admin(message.from_user.id) or has_editor_permission(message.from_user.id, "report")):
-        return await message.reply("❌ আপনার এই কমান্ড ব্যবহারের অনুমতি নেই!")
-    
-    report_text = "📋 <b>রিপোর্ট:</b>\n\n"
-    
     # Total Clicks and Visits
-    cur.execute("SELECT COUNT(*), SUM(CASE WHEN is_visit = 1 THEN 1 ELSE 0 END) FROM clicks")
-    total_clicks, total_visits = cur.fetchone()
-    report_text += f"🔗 মোট ক্লিক: {total_clicks or 0}\n"
-    report_text += f"👁️ মোট ভিজিট (১২+ সেকেন্ড): {total_visits or 0}\n\n"
+    parts.append(f"🔗 মোট ক্লিক: {total_clicks or 0}\n")
+    parts.append(f"👁️ মোট ভিজিট (১২+ সেকেন্ড): {total_visits or 0}\n\n")
 
     # Top Employees by Visits
-    cur.execute("SELECT username, total_visits FROM employees ORDER BY total_visits DESC LIMIT 5")
-    top_employees = cur.fetchall()
     if top_employees:
-        report_text += "📈 <b>শীর্ষ ৫ এমপ্লয়ি (ভিজিট অনুযায়ী):</b>\n"
-        for i, (username, visits) in enumerate(top_employees):
-            report_text += f"{i+1}. @{username}: {visits} ভিজিট\n"
-        report_text += "\n"
+        parts.append("📈 <b>শীর্ষ ৫ এমপ্লয়ি (ভিজিট অনুযায়ী):</b>\n")
+        parts.extend(f"{i+1}. @{username}: {visits} ভিজিট\n" for i, (username, visits) in enumerate(top_employees))
+        parts.append("\n")
 
     # Recent Withdraw Requests (Pending)
-    cur.execute("""
-        SELECT employee_username, usdt_amount, payment_method, payment_detail, request_date
-        FROM withdraw_requests WHERE status = 'pending' ORDER BY request_date DESC LIMIT 5
-    """)
-    pending_withdraws = cur.fetchall()
     if pending_withdraws:
-        report_text += "⏳ <b>সাম্প্রতিক পেন্ডিং উত্তোলন অনুরোধ:</b>\n"
-        for username, amount, method, detail, date in pending_withdraws:
-            report_text += f"• @{username}: {amount:.2f} USDT ({method}, {detail}) - {date}\n"
-        report_text += "\n"
+        parts.append("⏳ <b>সাম্প্রতিক পেন্ডিং উত্তোলন অনুরোধ:</b>\n")
+        parts.extend(f"• @{username}: {amount:.2f} USDT ({method}, {detail}) - {date}\n"
+                     for username, amount, method, detail, date in pending_withdraws)
+        parts.append("\n")
     else:
-        report_text += "ℹ️ কোনো পেন্ডিং উত্তোলন অনুরোধ নেই।\n\n"
+        parts.append("ℹ️ কোনো পেন্ডিং উত্তোলন অনুরোধ নেই।\n\n")
 
-    await message.reply(report_text, parse_mode=ParseMode.HTML)
+    return split_message("".join(parts))
+
+@dp.message(Command("report"), EditorFilter("report")) # Now also for editors
+async def get_report(message: types.Message):
+    global _report_cache, _report_dirty, _report_data_version
+    # The lock keeps concurrent /report calls from rebuilding the same report in parallel
+    async with _report_lock:
+        # data_version changes whenever another connection commits, e.g. a web worker process writing clicks
+        cur = await db.execute("PRAGMA data_version")
+        data_version = (await cur.fetchone())[0]
+        if _report_dirty or _report_cache is None or data_version != _report_data_version:
+            # Cleared before the rebuild so a write that lands during it marks the cache dirty again
+            _report_dirty = False
+            _report_data_version = data_version
+            try:
+                _report_cache = await build_report()
+            except Exception:
+                _report_dirty = True
+                raise
+
+    for i, chunk in enumerate(_report_cache):
+        if i:
+            await asyncio.sleep(1 / 28) # Stay under Telegram's per-bot send rate
+        await message.reply(chunk, parse_mode=ParseMode.HTML)
 
 
 # --- Balance and Visit Adjustment ---
 
-@dp.message(Command("set_usdt"))
+@dp.message(Command("set_usdt"), AdminFilter())
 async def set_usdt_rate_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
+    global usdt_rate_per_1000
     try:
         parts = message.text.split()
         if len(parts) < 2:
@@ -775,70 +1259,71 @@ async def set_usdt_rate_handler(message: types.Message):
         if usdt_amount <= 0:
             return await message.reply("❌ USDT রেট অবশ্যই 0 এর বেশি হতে হবে।")
         
-        cur.execute("INSERT OR REPLACE INTO global_settings (key, value) VALUES (?, ?)", ('usdt_rate_per_1000_visits', str(usdt_amount)))
-        conn.commit()
+        async with write_transaction():
+            await db.execute("INSERT OR REPLACE INTO global_settings (key, value) VALUES (?, ?)", ('usdt_rate_per_1000_visits', str(usdt_amount)))
+        usdt_rate_per_1000 = usdt_amount
         await message.reply(f"✅ সফলভাবে 1000 ভিজিট এর জন্য USDT রেট সেট করা হলো: {usdt_amount:.2f} USDT")
     except ValueError:
         await message.reply("❌ অবৈধ সংখ্যা। সঠিকভাবে লিখুন: /set_usdt <amount>")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("em_visit_add"))
+# "/em_visit_add @username <visits>" and "/em_visit_minus @username <visits>"
+VISIT_ADJUST_RE = re.compile(r"/\S+\s+@?(?P<username>\S+)\s+(?P<visits>\d+)(?!\S)")
+
+@dp.message(Command("em_visit_add"), AdminFilter())
 async def employee_visit_add_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
     try:
-        parts = message.text.split()
-        if len(parts) < 3:
+        match = VISIT_ADJUST_RE.match(message.text)
+        if not match:
             return await message.reply("⚠️ সঠিকভাবে লিখুন: /em_visit_add @username <visits>")
         
-        target_username = parts[1].replace('@', '')
-        visits_to_add = int(parts[2])
+        target_username = match["username"].replace('@', '')
+        visits_to_add = int(match["visits"])
         if visits_to_add <= 0:
             return await message.reply("❌ যোগ করার ভিজিট সংখ্যা অবশ্যই 0 এর বেশি হতে হবে।")
         
-        cur.execute("UPDATE employees SET total_visits = total_visits + ? WHERE username = ?", (visits_to_add, target_username))
-        conn.commit()
-        if cur.rowcount == 0:
+        # RETURNING hands back the new total, or no row when the employee doesn't exist
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET total_visits = total_visits + ? WHERE username = ? RETURNING total_visits",
+                                   (visits_to_add, target_username))
+            row = await cur.fetchone()
+        if row is None:
             return await message.reply(f"ℹ️ @{target_username} নামে কোনো কর্মচারী পাওয়া যায়নি।")
+        invalidate_report()
         
-        await message.reply(f"✅ @{target_username} এর ভিজিট সংখ্যায় {visits_to_add} ভিজিট যোগ করা হলো।")
-    except ValueError:
-        await message.reply("❌ অবৈধ সংখ্যা। সঠিকভাবে লিখুন: /em_visit_add @username <visits>")
+        await message.reply(f"✅ @{target_username} এর ভিজিট সংখ্যায় {visits_to_add} ভিজিট যোগ করা হলো। নতুন মোট: {row[0]}")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
-@dp.message(Command("em_visit_minus"))
+@dp.message(Command("em_visit_minus"), AdminFilter())
 async def employee_visit_minus_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
     try:
-        parts = message.text.split()
-        if len(parts) < 3:
+        match = VISIT_ADJUST_RE.match(message.text)
+        if not match:
             return await message.reply("⚠️ সঠিকভাবে লিখুন: /em_visit_minus @username <visits>")
         
-        target_username = parts[1].replace('@', '')
-        visits_to_minus = int(parts[2])
+        target_username = match["username"].replace('@', '')
+        visits_to_minus = int(match["visits"])
         if visits_to_minus <= 0:
             return await message.reply("❌ কমানোর ভিজিট সংখ্যা অবশ্যই 0 এর বেশি হতে হবে।")
         
         # Ensure total_visits doesn't go below zero
-        cur.execute("UPDATE employees SET total_visits = MAX(0, total_visits - ?) WHERE username = ?", (visits_to_minus, target_username))
-        conn.commit()
-        if cur.rowcount == 0:
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET total_visits = MAX(0, total_visits - ?) WHERE username = ? RETURNING total_visits",
+                                   (visits_to_minus, target_username))
+            row = await cur.fetchone()
+        if row is None:
             return await message.reply(f"ℹ️ @{target_username} নামে কোনো কর্মচারী পাওয়া যায়নি।")
+        invalidate_report()
         
-        await message.reply(f"✅ @{target_username} এর ভিজিট সংখ্যা থেকে {visits_to_minus} ভিজিট কমানো হলো।")
-    except ValueError:
-        await message.reply("❌ অবৈধ সংখ্যা। সঠিকভাবে লিখুন: /em_visit_minus @username <visits>")
+        await message.reply(f"✅ @{target_username} এর ভিজিট সংখ্যা থেকে {visits_to_minus} ভিজিট কমানো হলো। নতুন মোট: {row[0]}")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
 
 # --- ADMIN COMMAND: Convert total_visits to usdt_balance (still admin only for specific employee conversion) ---
-@dp.message(Command("convert_visits_to_usdt"))
+@dp.message(Command("convert_visits_to_usdt"), AdminFilter())
 async def convert_visits_to_usdt_handler(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.reply("❌ আপনি অ্যাডমিন নন!")
     try:
         parts = message.text.split()
         if len(parts) < 2:
@@ -846,33 +1331,39 @@ async def convert_visits_to_usdt_handler(message: types.Message):
         
         target_username = parts[1].replace('@', '')
 
-        cur.execute("SELECT total_visits, usdt_balance FROM employees WHERE username = ?", (target_username,))
-        employee_data = cur.fetchone()
+        async with reader() as rdb:
+            cur = await rdb.execute("SELECT total_visits FROM employees WHERE username = ?", (target_username,))
+            employee_data = await cur.fetchone()
 
         if not employee_data:
             return await message.reply(f"ℹ️ @{target_username} নামে কোনো কর্মচারী পাওয়া যায়নি।")
         
         total_visits = employee_data[0]
-        current_usdt_balance = employee_data[1]
 
-        if total_visits == 0:
+        if total_visits <= 0:
             return await message.reply(f"ℹ️ @{target_username} এর কোনো নতুন ভিজিট নেই যা USDT তে কনভার্ট করা যাবে।")
 
-        cur.execute("SELECT value FROM global_settings WHERE key = 'usdt_rate_per_1000_visits'")
-        usdt_rate_str = cur.fetchone()
-        usdt_rate = float(usdt_rate_str[0]) if usdt_rate_str else 0.0
+        usdt_rate = usdt_rate_per_1000
 
         if usdt_rate == 0.0:
             return await message.reply("❌ USDT রেট সেট করা নেই। দয়া করে অ্যাডমিন `/set_usdt` কমান্ড ব্যবহার করে সেট করুন।")
 
         usdt_to_add = (total_visits / 1000) * usdt_rate
 
-        # Update usdt_balance and reset total_visits
-        cur.execute("UPDATE employees SET usdt_balance = ?, total_visits = 0 WHERE username = ?",
-                    (current_usdt_balance + usdt_to_add, target_username))
-        conn.commit()
-
-        await message.reply(f"✅ @{target_username} এর {total_visits} ভিজিট সফলভাবে {usdt_to_add:.2f} USDT তে কনভার্ট করা হয়েছে। বর্তমান উত্তোলনযোগ্য ব্যালেন্স: {current_usdt_balance + usdt_to_add:.2f} USDT। ভিজিট সংখ্যা ০ তে রিসেট করা হলো।")
+        # Update usdt_balance and take the converted visits off total_visits. Both are relative to the stored values,
+        # so visits counted or a withdrawal made since the SELECT are kept; RETURNING gives the resulting balance
+        # and the visits left over (those counted since the SELECT). The total_visits guard makes a concurrent
+        # conversion of the same visits (e.g. a double tap) match no row instead of paying them out twice.
+        async with write_transaction():
+            cur = await db.execute("UPDATE employees SET usdt_balance = usdt_balance + ?, total_visits = total_visits - ? WHERE username = ? AND total_visits >= ? RETURNING usdt_balance, total_visits",
+                                   (usdt_to_add, total_visits, target_username, total_visits))
+            row = await cur.fetchone()
+        if row is None:
+            return await message.reply(f"ℹ️ @{target_username} এর যথেষ্ট ভিজিট নেই যা USDT তে কনভার্ট করা যাবে।")
+        new_usdt_balance, remaining_visits = row
+        invalidate_report()
+
+        await message.reply(f"✅ @{target_username} এর {total_visits} ভিজিট সফলভাবে {usdt_to_add:.2f} USDT তে কনভার্ট করা হয়েছে। বর্তমান উত্তোলনযোগ্য ব্যালেন্স: {new_usdt_balance:.2f} USDT। কনভার্ট করা ভিজিটগুলো বাদ দেওয়া হলো, বাকি ভিজিট: {remaining_visits}।")
 
     except ValueError:
         await message.reply("❌ অবৈধ ইনপুট।")
@@ -886,33 +1377,37 @@ async def claim_usdt_handler(message: types.Message):
     if not username:
         return await message.reply("❌ আপনার টেলিগ্রাম ইউজারনেম সেট করা নেই।")
 
-    cur.execute("SELECT total_visits, usdt_balance FROM employees WHERE username = ?", (username,))
-    employee_data = cur.fetchone()
+    async with reader() as rdb:
+        cur = await rdb.execute("SELECT total_visits FROM employees WHERE username = ?", (username,))
+        employee_data = await cur.fetchone()
 
     if not employee_data:
         return await message.reply("❌ আপনি একজন নিবন্ধিত কর্মচারী নন। `/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
     
     total_visits = employee_data[0]
-    current_usdt_balance = employee_data[1]
 
-    if total_visits == 0:
+    if total_visits <= 0:
         return await message.reply("ℹ️ আপনার কোনো নতুন ভিজিট নেই যা USDT তে কনভার্ট করা যাবে।")
 
-    cur.execute("SELECT value FROM global_settings WHERE key = 'usdt_rate_per_1000_visits'")
-    usdt_rate_str = cur.fetchone()
-    usdt_rate = float(usdt_rate_str[0]) if usdt_rate_str else 0.0
+    usdt_rate = usdt_rate_per_1000
 
     if usdt_rate == 0.0:
         return await message.reply("❌ USDT রেট সেট করা নেই। দয়া করে অ্যাডমিনকে `/set_usdt` কমান্ড ব্যবহার করে সেট করতে বলুন।")
 
     usdt_to_add = (total_visits / 1000) * usdt_rate
 
-    # Update usdt_balance and reset total_visits
-    cur.execute("UPDATE employees SET usdt_balance = ?, total_visits = 0 WHERE username = ?",
-                (current_usdt_balance + usdt_to_add, username))
-    conn.commit()
+    # Update usdt_balance and take the converted visits off total_visits, relative to the stored values and
+    # guarded against a concurrent claim of the same visits (see above)
+    async with write_transaction():
+        cur = await db.execute("UPDATE employees SET usdt_balance = usdt_balance + ?, total_visits = total_visits - ? WHERE username = ? AND total_visits >= ? RETURNING usdt_balance, total_visits",
+                               (usdt_to_add, total_visits, username, total_visits))
+        row = await cur.fetchone()
+    if row is None:
+        return await message.reply("ℹ️ আপনার যথেষ্ট ভিজিট নেই যা USDT তে কনভার্ট করা যাবে।")
+    new_usdt_balance, remaining_visits = row
+    invalidate_report()
 
-    await message.reply(f"✅ আপনার {total_visits} ভিজিট সফলভাবে {usdt_to_add:.2f} USDT তে কনভার্ট করা হয়েছে। আপনার বর্তমান উত্তোলনযোগ্য ব্যালেন্স: {current_usdt_balance + usdt_to_add:.2f} USDT। ভিজিট সংখ্যা ০ তে রিসেট করা হলো।")
+    await message.reply(f"✅ আপনার {total_visits} ভিজিট সফলভাবে {usdt_to_add:.2f} USDT তে কনভার্ট করা হয়েছে। আপনার বর্তমান উত্তোলনযোগ্য ব্যালেন্স: {new_usdt_balance:.2f} USDT। কনভার্ট করা ভিজিটগুলো বাদ দেওয়া হলো, বাকি ভিজিট: {remaining_visits}।")
 
 
 @dp.message(Command("my_balance"))
@@ -921,24 +1416,21 @@ async def my_balance_handler(message: types.Message):
     if not username:
         return await message.reply("❌ আপনার টেলিগ্রাম ইউজারনেম সেট করা নেই।")
     
-    cur.execute("SELECT total_visits, usdt_balance FROM employees WHERE username = ?", (username,))
-    employee_data = cur.fetchone()
+    async with reader() as rdb:
+        cur = await rdb.execute("SELECT total_visits, usdt_balance FROM employees WHERE username = ?", (username,))
+        employee_data = await cur.fetchone()
 
-    if not employee_data:
-        return await message.reply("❌ আপনি একজন নিবন্ধিত কর্মচারী নন। `/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
-    
-    total_visits = employee_data[0]
-    current_usdt_balance = employee_data[1] 
-
-    cur.execute("SELECT value FROM global_settings WHERE key = 'usdt_rate_per_1000_visits'")
-    usdt_rate_str = cur.fetchone()
-    usdt_rate = float(usdt_rate_str[0]) if usdt_rate_str else 0.0 
+        if not employee_data:
+            return await message.reply("❌ আপনি একজন নিবন্ধিত কর্মচারী নন। `/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
+        
+        total_visits = employee_data[0]
+        current_usdt_balance = employee_data[1] 
 
-    calculated_usdt = (total_visits / 1000) * usdt_rate
+        # Check for pending withdrawals
+        cur = await rdb.execute("SELECT COUNT(*) FROM withdraw_requests WHERE employee_username = ? AND status = 'pending'", (username,))
+        pending_withdrawals = (await cur.fetchone())[0]
 
-    # Check for pending withdrawals
-    cur.execute("SELECT COUNT(*) FROM withdraw_requests WHERE employee_username = ? AND status = 'pending'", (username,))
-    pending_withdrawals = cur.fetchone()[0]
+    calculated_usdt = (total_visits / 1000) * usdt_rate_per_1000
 
     await message.reply(
         f"💰 <b>আপনার ব্যালেন্স:</b>\n"
@@ -952,11 +1444,18 @@ async def my_balance_handler(message: types.Message):
 
 
 # --- Withdrawal System (Employee Side) ---
+# Withdrawals are only possible in these fixed amounts, offered as keyboard buttons
+WITHDRAW_BUTTONS = {f"Withdraw ${amt:.2f}": amt for amt in (1.00, 5.00, 10.00, 30.00, 100.00)}
+WITHDRAW_PAYMENT_METHODS = frozenset({"Bkash", "Binance"})
+# Replies that mean "no comment" at the optional comment step
+NO_COMMENT_REPLIES = frozenset({"না", "নাই", "na", "Na", "NA"})
+
 @dp.message(Command("withdraw_usdt"))
 async def start_withdraw(message: types.Message, state: FSMContext):
     username = message.from_user.username
-    cur.execute("SELECT usdt_balance, profile_set, bkash_number, binance_id FROM employees WHERE username = ?", (username,))
-    employee_data = cur.fetchone()
+    async with reader() as rdb:
+        cur = await rdb.execute("SELECT usdt_balance, profile_set, bkash_number, binance_id FROM employees WHERE username = ?", (username,))
+        employee_data = await cur.fetchone()
 
     if not employee_data:
         return await message.reply("❌ আপনি একজন নিবন্ধিত কর্মচারী নন। `/join_employee` কমান্ড ব্যবহার করে যুক্ত হন।")
@@ -972,37 +1471,35 @@ async def start_withdraw(message: types.Message, state: FSMContext):
     if usdt_balance < 1.00: # Minimum withdrawal amount
         return await message.reply(f"❌ উত্তোলনের জন্য আপনার ব্যালেন্সে কমপক্ষে 1.00 USDT থাকতে হবে। আপনার বর্তমান ব্যালেন্স: {usdt_balance:.2f} USDT")
 
-    amounts = [1.00, 5.00, 10.00, 30.00, 100.00]
-    available_amounts = [amt for amt in amounts if usdt_balance >= amt]
+    available_buttons = [button for button, amt in WITHDRAW_BUTTONS.items() if usdt_balance >= amt]
 
-    if not available_amounts:
+    if not available_buttons:
         return await message.reply(f"❌ আপনার বর্তমান ব্যালেন্স {usdt_balance:.2f} USDT দিয়ে কোনো উত্তোলন সম্ভব নয়।")
 
     keyboard = types.ReplyKeyboardMarkup(
         keyboard=[
-            [types.KeyboardButton(text=f"Withdraw ${amt:.2f}")] for amt in available_amounts
+            [types.KeyboardButton(text=button)] for button in available_buttons
         ],
         resize_keyboard=True,
         one_time_keyboard=True
     )
-    await message.answer("আপনি কত USDT উত্তোলন করতে চান? (আপনার বর্তমান ব্যালেন্স: {usdt_balance:.2f} USDT)", reply_markup=keyboard)
+    await message.answer(f"আপনি কত USDT উত্তোলন করতে চান? (আপনার বর্তমান ব্যালেন্স: {usdt_balance:.2f} USDT)", reply_markup=keyboard)
+    # The balance and payment details are kept for the later steps so they don't have to look the profile up again;
+    # the final step re-checks the balance in its UPDATE
+    await state.update_data(usdt_balance=usdt_balance, bkash_number=bkash_number, binance_id=binance_id)
     await state.set_state(Withdrawal.amount)
 
 @dp.message(Withdrawal.amount)
 async def process_withdraw_amount(message: types.Message, state: FSMContext):
     try:
-        text = message.text.replace("Withdraw $", "")
-        amount = float(text)
+        amount = WITHDRAW_BUTTONS.get((message.text or "").strip())
+        if amount is None:
+            return await message.reply("❌ অনুগ্রহ করে নিচের বাটন থেকে উত্তোলনের পরিমাণ বেছে নিন।")
         
-        username = message.from_user.username
-        cur.execute("SELECT usdt_balance FROM employees WHERE username = ?", (username,))
-        current_balance = cur.fetchone()[0]
-
-        if amount <= 0:
-            return await message.reply("❌ উত্তোলনের পরিমাণ অবশ্যই 0 এর বেশি হতে হবে।")
+        current_balance = (await state.get_data())['usdt_balance']
 
         if amount > current_balance:
-            return await message.reply(f"❌ আপনার ব্যালেন্স যথেষ্ট নয়। আপনার ব্যালেন্স: {current_balance:.2f} USDT। অনুগ্রহ করে সঠিক পরিমাণ বেছে নিন বা টাইপ করুন।")
+            return await message.reply(f"❌ আপনার ব্যালেন্স যথেষ্ট নয়। আপনার ব্যালেন্স: {current_balance:.2f} USDT। অনুগ্রহ করে সঠিক পরিমাণ বেছে নিন।")
         
         await state.update_data(usdt_amount=amount)
 
@@ -1018,8 +1515,6 @@ async def process_withdraw_amount(message: types.Message, state: FSMContext):
         await message.answer("কোন মাধ্যমে পেমেন্ট নিতে চান?", reply_markup=keyboard)
         await state.set_state(Withdrawal.payment_method)
 
-    except ValueError:
-        await message.reply("❌ অনুগ্রহ করে সঠিক উত্তোলনের পরিমাণ বেছে নিন বা সংখ্যায় টাইপ করুন।")
     except Exception as e:
         await message.reply(f"❌ একটি ত্রুটি হয়েছে: {e}")
         await state.clear()
@@ -1027,14 +1522,12 @@ async def process_withdraw_amount(message: types.Message, state: FSMContext):
 @dp.message(Withdrawal.payment_method)
 async def process_withdraw_payment_method(message: types.Message, state: FSMContext):
     payment_method = message.text
-    if payment_method not in ["Bkash", "Binance"]:
+    if payment_method not in WITHDRAW_PAYMENT_METHODS:
         return await message.reply("❌ অনুগ্রহ করে 'Bkash' অথবা 'Binance' বেছে নিন।")
     
-    username = message.from_user.username
-    cur.execute("SELECT bkash_number, binance_id FROM employees WHERE username = ?", (username,))
-    profile_data = cur.fetchone()
-    bkash_number = profile_data[0]
-    binance_id = profile_data[1]
+    data = await state.get_data()
+    bkash_number = data['bkash_number']
+    binance_id = data['binance_id']
 
     if payment_method == "Bkash" and not bkash_number:
         return await message.reply("⚠️ আপনার প্রোফাইলে বিকাশ নম্বর সেট করা নেই। দয়া করে সেট করুন `/set_profile`")
@@ -1048,7 +1541,7 @@ async def process_withdraw_payment_method(message: types.Message, state: FSMCont
 @dp.message(Withdrawal.comment)
 async def process_withdraw_comment(message: types.Message, state: FSMContext):
     comment = message.text.strip()
-    if comment.lower() == 'না':
+    if comment in NO_COMMENT_REPLIES:
         comment = ""
     elif len(comment) > 60:
         return await message.reply("❌ মন্তব্য ৬০ অক্ষরের বেশি হতে পারবে না।")
@@ -1061,154 +1554,468 @@ async def process_withdraw_comment(message: types.Message, state: FSMContext):
     amount = data['usdt_amount']
     payment_method = data['payment_method']
     
-    # CORRECTED LINE:
-    cur.execute("SELECT bkash_number, binance_id FROM employees WHERE username = ?", (username,))
-    profile_data = cur.fetchone()
-    payment_detail = profile_data[0] if payment_method == "Bkash" else profile_data[1]
-
-    # Save withdrawal request to DB
-    cur.execute("""
-        INSERT INTO withdraw_requests (employee_username, usdt_amount, payment_method, payment_detail, comment)
-        VALUES (?, ?, ?, ?, ?)
-    """, (username, amount, payment_method, payment_detail, comment))
-    conn.commit()
-
-    # Deduct amount from user's usdt_balance
-    cur.execute("UPDATE employees SET usdt_balance = usdt_balance - ? WHERE username = ?", (amount, username))
-    conn.commit()
+    payment_detail = data['bkash_number'] if payment_method == "Bkash" else data['binance_id']
+
+    # Deduct amount from user's usdt_balance; the UPDATE itself re-checks the balance, so two withdrawals
+    # racing each other (or a change since /withdraw_usdt) can never take it below zero.
+    # The request is saved in the same transaction, so a deduction is never committed without it or vice versa.
+    async with write_transaction():
+        cur = await db.execute("UPDATE employees SET usdt_balance = usdt_balance - ? WHERE username = ? AND usdt_balance >= ?",
+                               (amount, username, amount))
+        deducted = cur.rowcount > 0
+        if deducted:
+            await db.execute("""
+                INSERT INTO withdraw_requests (employee_username, usdt_amount, payment_method, payment_detail, comment)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, amount, payment_method, payment_detail, comment))
+    if not deducted:
+        await state.clear()
+        return await message.reply("❌ আপনার ব্যালেন্স পরিবর্তিত হয়েছে, এই পরিমাণ উত্তোলন সম্ভব নয়। আবার চেষ্টা করুন: `/withdraw_usdt`",
+                                   reply_markup=types.ReplyKeyboardRemove())
+    invalidate_report()
 
     await message.reply(
         f"✅ আপনার উত্তোলনের অনুরোধ সফলভাবে পাঠানো হয়েছে!\n"
         f"পরিমাণ: {amount:.2f} USDT\n"
         f"পেমেন্ট মাধ্যম: {payment_method}\n"
-        f"পেমেন্ট ডিটেইল: {payment_detail}\n"
-        f"মন্তব্য: {comment if comment else 'নেই'}\n\n"
+        f"পেমেন্ট ডিটেইল: {html_decoration.quote(payment_detail)}\n"
+        f"মন্তব্য: {html_decoration.quote(comment) if comment else 'নেই'}\n\n"
         "আমাদের অ্যাডমিন আপনার অনুরোধ পর্যালোচনা করবেন।"
     , parse_mode=ParseMode.HTML, reply_markup=types.ReplyKeyboardRemove())
     await state.clear()
 
+
+# --- Refusals for unprivileged users ---
+# Registered after every command handler: these only match once AdminFilter/EditorFilter turned the real handler down
+@dp.message(Command(*ADMIN_ONLY_COMMANDS))
+async def not_admin_handler(message: types.Message):
+    await message.reply("❌ আপনি অ্যাডমিন নন!")
+
+@dp.message(Command(*EDITOR_COMMANDS))
+async def no_permission_handler(message: types.Message):
+    await message.reply("❌ আপনার এই কমান্ড ব্যবহারের অনুমতি নেই!")
+
+
 # --- Web Server for handling external HTTP requests (from footer.php) ---
 
-async def track_click_handler(request):
+# Tracked clicks are queued by track_click_handler and written in batches by click_writer,
+# so a burst of clicks costs one commit instead of one per request
+click_queue = asyncio.Queue()
+CLICK_BATCH_SIZE = 500
+# After the first queued click the writer waits this long, so a burst is committed as one batch;
+# when a full batch is already waiting it skips the wait so a backlog drains at full speed
+CLICK_FLUSH_INTERVAL = 0.25
+# While clicks keep arriving the employees counters are carried across batches and written at most this often,
+# so a hot referral's row is rewritten once per interval rather than once per batch; an empty queue flushes them at once
+COUNTER_FLUSH_INTERVAL = 2.0
+
+CLICK_INSERT_SQL = """
+    INSERT INTO clicks (ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name,
+                        user_agent, page_url, is_visit, is_click, is_telegram_browser, unique_daily_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# A visit only counts if its row gets the unique daily key; the key may already be taken by an earlier batch,
+# another worker process or a row earlier in the same batch
+CLICK_VISIT_INSERT_SQL = CLICK_INSERT_SQL + "ON CONFLICT(unique_daily_key) DO NOTHING"
+
+# What is queued but not committed yet, which track_click_handler's SELECT can't see: the clicks per viewer and day
+# (for the daily limit) and the unique daily keys claimed by queued visits. click_writer releases a batch's entries
+# once it is committed or has failed.
+_queued_viewer_clicks = Counter() # (viewer, date) -> queued clicks
+_queued_visit_keys = set()
+
+def release_queued_click(click_row, viewer_key):
+    if viewer_key is not None:
+        _queued_viewer_clicks[viewer_key] -= 1
+        if _queued_viewer_clicks[viewer_key] <= 0:
+            del _queued_viewer_clicks[viewer_key]
+    _queued_visit_keys.discard(click_row[-1])
+
+# Adds the summed per-employee bumps to employees.total_clicks/total_visits, inside the caller's transaction
+async def write_employee_counters(clicks_by_ref, visits_by_ref):
+    await db.executemany("UPDATE employees SET total_clicks = total_clicks + ?, total_visits = total_visits + ? WHERE username = ?",
+                         [(clicks, visits_by_ref[ref], ref) for ref, clicks in clicks_by_ref.items()])
+
+async def click_writer():
+    pending_clicks, pending_visits = Counter(), Counter()
+    last_counter_flush = time.monotonic()
     try:
-        data = await request.json()
-        ref_by_employee = data.get('ref')
-        viewer_username = data.get('viewer_username') # From JS
-        viewer_telegram_id = data.get('viewer_telegram_id') # From JS
-        viewer_full_name = data.get('viewer_full_name') # From JS
-        user_agent = data.get('user_agent', 'Unknown User')
-        page_url = data.get('page_url', 'Unknown URL')
-        is_visit_flag = data.get('is_visit', False) # True if JS sends after 12s
-        is_telegram_browser = data.get('is_telegram_browser', False)
-
-        today_date = datetime.date.today().isoformat()
-        # More generalized unique daily key for 20 visits per day for the same viewer on the same page
-        # The key should combine viewer, date, and page_url (not ref_by_employee for uniqueness across multiple referrals to the same page)
-        unique_daily_key_for_viewer_page = f"{viewer_telegram_id or viewer_username}_{today_date}_{page_url}"
-
-        # Check if this specific page has been visited by this viewer today (to avoid double counting same page visit for the same day)
-        cur.execute("SELECT id FROM clicks WHERE unique_daily_key = ? AND is_visit = 1", (unique_daily_key_for_viewer_page,))
-        if cur.fetchone():
-            logging.info(f"Duplicate visit for {unique_daily_key_for_viewer_page}. Skipping visit count.")
-            # Still track the click if it's new, but don't increment visit count again
-            # We will still log the click, but only increment total_visits once per page per day per viewer
-            # However, the user also needs to prevent general 20 clicks per day.
-            # So, we first check the 20 clicks limit, then the unique visit.
-
-            # We need to refine the unique_daily_key to prevent more than 20 TOTAL clicks by the same viewer_telegram_id/viewer_username PER DAY, regardless of referrer or page.
-            # The existing unique_daily_key is tied to ref_by_employee and page_url, which is too specific for the 20-visit limit.
-            # Let's adjust the 20 visit limit check.
-
-            # Check daily TOTAL click limit for this viewer (max 20 per day per viewer)
-            cur.execute("""
-                SELECT COUNT(*) FROM clicks 
-                WHERE (viewer_telegram_id = ? OR viewer_username = ?) 
-                AND STRFTIME('%Y-%m-%d', timestamp) = ?
-            """, (viewer_telegram_id, viewer_username, today_date))
-            
-            total_clicks_today_for_viewer = cur.fetchone()[0]
-
-            if total_clicks_today_for_viewer >= 20:
-                logging.info(f"Daily total click limit reached for {viewer_username}.")
-                return web.json_response({"status": "limit_reached", "message": "Daily total click limit reached for this user."})
-            
-            # If it's a duplicate visit for the same page/viewer, we will still record the click, but not increment employee's total_visits
-            # The employee's total_visits is only for UNIQUE visits (12+ seconds) based on page_url per viewer per day.
-            # If is_visit_flag is True, and it's a duplicate for unique_daily_key_for_viewer_page, we don't increment total_visits for employee.
-            # But we still record this click in 'clicks' table as is_click = True.
-
-            # Check if this specific page+employee has already been counted as a visit by this user today
-            # This is for the employee's total_visits
-            unique_employee_page_visit_key = f"{ref_by_employee}_{viewer_telegram_id or viewer_username}_{today_date}_{page_url}"
-            cur.execute("SELECT id FROM clicks WHERE unique_daily_key = ? AND is_visit = 1", (unique_employee_page_visit_key,))
-            is_duplicate_employee_page_visit = cur.fetchone() is not None
-
-            # Insert into clicks table
-            cur.execute("""
-                INSERT INTO clicks (ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name,
-                                    user_agent, page_url, is_visit, is_click, is_telegram_browser, unique_daily_key)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name,
-                user_agent, page_url, is_visit_flag, True, is_telegram_browser, unique_employee_page_visit_key
-            ))
-            conn.commit()
-
-            # Update employee's total_visits only if it's a new unique visit for them
-            if is_visit_flag and not is_duplicate_employee_page_visit:
-                cur.execute("UPDATE employees SET total_visits = total_visits + 1 WHERE username = ?", (ref_by_employee,))
-                conn.commit()
-            
-            # Always update total_clicks for the employee for any new click (even if it's a duplicate visit or not a visit)
-            cur.execute("UPDATE employees SET total_clicks = total_clicks + 1 WHERE username = ?", (ref_by_employee,))
-            conn.commit()
-            
-            logging.info(f"Tracked click for ref: {ref_by_employee}, viewer: {viewer_username}, URL: {page_url}, Visit: {is_visit_flag}, Duplicate Visit: {is_duplicate_employee_page_visit}")
-
-            if ADMIN_CHAT_ID:
+        while True:
+            batch = [await click_queue.get()]
+            if click_queue.qsize() < CLICK_BATCH_SIZE:
+                await asyncio.sleep(CLICK_FLUSH_INTERVAL)
+            while len(batch) < CLICK_BATCH_SIZE:
                 try:
-                    domain_name = urlparse(page_url).netloc
-                    status_emoji = "✅ ভিজিট" if is_visit_flag else "🔗 ক্লিক"
-                    notification_message = (f"<b>{status_emoji} রেকর্ড করা হয়েছে!</b>\n"
-                                          f"<b>রেফারেল:</b> <code>{ref_by_employee}</code>\n"
-                                          f"<b>ডোমেইন:</b> {domain_name}\n"
-                                          f"<b>পেজ URL:</b> {hcode(page_url)}\n"
-                                          f"<b>ভিউয়ার:</b> {hbold(viewer_full_name)} (@{viewer_username})\n"
-                                          f"<b>ব্রাউজার:</b> {'Telegram' if is_telegram_browser else 'External'}\n"
-                                          f"<b>ইউজার এজেন্ট:</b> <code>{user_agent}</code>")
-                    if is_visit_flag and is_duplicate_employee_page_visit:
-                        notification_message += "\n\n(ℹ️ এই ভিজিটটি আজ এই পেজের জন্য ইতিমধ্যে গণনা করা হয়েছে, তাই এমপ্লয়ির ভিজিট সংখ্যা বাড়ানো হয়নি।)"
-
-                    await bot.send_message(
-                        chat_id=int(ADMIN_CHAT_ID),
-                        text=notification_message,
-                        parse_mode=ParseMode.HTML
-                    )
+                    batch.append(click_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                # Each batch is its own IMMEDIATE transaction: the write lock is taken up front, so the batch never has to
+                # upgrade mid-way while a worker process holds it, and no handler's statements can end up in it
+                async with write_transaction():
+                    # The inserts decide what is credited: a visit whose unique daily key was already taken is stored
+                    # as a plain repeat visit (NULL key) and only counts towards total_clicks
+                    counted_visit_refs = []
+                    click_rows = []
+                    for click_row, _ in batch:
+                        if click_row[-1] is not None:
+                            cur = await db.execute(CLICK_VISIT_INSERT_SQL, click_row)
+                            if cur.rowcount:
+                                counted_visit_refs.append(click_row[0])
+                                continue
+                            click_row = click_row[:-1] + (None,)
+                        click_rows.append(click_row)
+                    await db.executemany(CLICK_INSERT_SQL, click_rows)
+                    # Every stored click counts towards total_clicks, only the inserted unique visits towards total_visits;
+                    # the bumps are summed per employee so each one gets a single UPDATE per flush
+                    clicks_by_ref = pending_clicks + Counter(click_row[0] for click_row, _ in batch)
+                    visits_by_ref = pending_visits + Counter(counted_visit_refs)
+                    flush_counters = click_queue.empty() or time.monotonic() - last_counter_flush >= COUNTER_FLUSH_INTERVAL
+                    if flush_counters:
+                        await write_employee_counters(clicks_by_ref, visits_by_ref)
+                # The pending counters only move on once the batch is committed, so a failed batch is not counted twice.
+                # They only ever hold bumps for rows this writer inserted and committed.
+                if flush_counters:
+                    pending_clicks, pending_visits = Counter(), Counter()
+                    last_counter_flush = time.monotonic()
+                else:
+                    pending_clicks, pending_visits = clicks_by_ref, visits_by_ref
+                invalidate_report()
+            except Exception as e:
+                logging.error(f"Failed to write click batch of {len(batch)}: {e}")
+            finally:
+                for click_row, viewer_key in batch:
+                    release_queued_click(click_row, viewer_key)
+                    click_queue.task_done()
+    finally:
+        # Carried counters belong to clicks rows that are already committed; write them before the writer stops,
+        # e.g. when the shutdown drain times out while clicks are still arriving
+        if pending_clicks:
+            try:
+                async with write_transaction():
+                    await write_employee_counters(pending_clicks, pending_visits)
+            except Exception as e:
+                logging.error(f"Failed to write carried click counters: {e}")
+
+# Admin notifications are sent by admin_notifier, paced under Telegram's ~30 messages/second limit.
+# When the queue is full new notifications are dropped rather than slowing down /track-click.
+notify_queue = asyncio.Queue(maxsize=1000)
+# Every web worker process runs its own notifier, so they share the rate limit between them
+NOTIFY_INTERVAL = WEB_WORKERS / 28
+NOTIFY_FIELD_LIMIT = 200
+
+async def admin_notifier():
+    while True:
+        batch = [await notify_queue.get()]
+        while True:
+            try:
+                batch.append(notify_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        # When notifications pile up, everything queued for the same referral goes out as one summary
+        by_ref = {}
+        for item in batch:
+            by_ref.setdefault(item[0], []).append(item)
+
+        for ref_by_employee, items in by_ref.items():
+            if len(items) == 1:
+                text = items[0][2]
+            else:
+                visits = sum(1 for _, is_visit, _ in items if is_visit)
+                text = (f"<b>📊 {len(items)}টি নতুন ক্লিক/ভিজিট রেকর্ড করা হয়েছে!</b>\n"
+                        f"<b>রেফারেল:</b> {hcode(ref_by_employee)}\n"
+                        f"✅ ভিজিট: {visits}, 🔗 ক্লিক: {len(items) - visits}")
+            try:
+                await bot.send_message(chat_id=ADMIN_CHAT_ID, text=text, parse_mode=ParseMode.HTML)
+            except TelegramRetryAfter as e:
+                # Flood control: wait as long as Telegram asks, then retry once instead of losing the notification
+                logging.warning(f"Admin notifications rate limited, retrying in {e.retry_after} s")
+                await asyncio.sleep(e.retry_after)
+                try:
+                    await bot.send_message(chat_id=ADMIN_CHAT_ID, text=text, parse_mode=ParseMode.HTML)
                 except Exception as e:
                     logging.error(f"Failed to send admin notification: {e}")
-            
-            return web.json_response({"status": "success", "message": "Click tracked successfully"})
+            except Exception as e:
+                logging.error(f"Failed to send admin notification: {e}")
+            await asyncio.sleep(NOTIFY_INTERVAL)
+
+        for _ in batch:
+            notify_queue.task_done()
+
+# Response bodies for the common /track-click outcomes, encoded once
+TRACK_QUEUED_BODY = orjson.dumps({"status": "success", "message": "Click queued for tracking"})
+TRACK_LIMIT_BODY = orjson.dumps({"status": "limit_reached", "message": "Daily total click limit reached for this user."})
+TRACK_RATE_LIMITED_BODY = orjson.dumps({"status": "error", "message": "Too many requests"})
+
+# Notifications show the site a click came from; the same few pages are tracked over and over
+@lru_cache(maxsize=4096)
+def page_domain(page_url):
+    return urlparse(page_url).netloc
+
+# web.json_response() goes through the stdlib json module; everything /track-click sends is encoded with orjson
+def orjson_response(data, status=200):
+    return web.Response(body=orjson.dumps(data), status=status, content_type="application/json")
+
+# An explicit JSON null counts as missing, so fields the notifier needs always get their default
+def _optional_str(data, key, default=None):
+    value = data.get(key)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"'{key}' must be a string")
+    return value
+
+# Decodes and validates a /track-click body; raises ValueError on a malformed payload
+def parse_click_payload(raw):
+    data = orjson.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("payload must be a JSON object")
+
+    ref_by_employee = _optional_str(data, 'ref')
+    if not ref_by_employee:
+        raise ValueError("'ref' is required")
+
+    viewer_telegram_id = data.get('viewer_telegram_id')
+    if isinstance(viewer_telegram_id, str) and viewer_telegram_id.isdigit():
+        viewer_telegram_id = int(viewer_telegram_id)
+    elif viewer_telegram_id is not None and (not isinstance(viewer_telegram_id, int) or isinstance(viewer_telegram_id, bool)):
+        raise ValueError("'viewer_telegram_id' must be an integer")
+
+    return (
+        ref_by_employee,
+        _optional_str(data, 'viewer_username'), # From JS
+        viewer_telegram_id, # From JS
+        _optional_str(data, 'viewer_full_name'), # From JS
+        _optional_str(data, 'user_agent', 'Unknown User'),
+        _optional_str(data, 'page_url', 'Unknown URL'),
+        bool(data.get('is_visit', False)), # True if JS sends after 12s
+        bool(data.get('is_telegram_browser', False)),
+    )
+
+async def track_click_handler(request):
+    try:
+        try:
+            (ref_by_employee, viewer_username, viewer_telegram_id, viewer_full_name,
+             user_agent, page_url, is_visit_flag, is_telegram_browser) = parse_click_payload(await request.read())
+        except ValueError as e: # orjson.JSONDecodeError is a ValueError
+            return orjson_response({"status": "error", "message": str(e)}, status=400)
+
+        today = datetime.date.today()
+        today_date = today.isoformat()
+        tomorrow_date = (today + datetime.timedelta(days=1)).isoformat()
+
+        # The employee's total_visits only counts UNIQUE visits (12+ seconds) per employee, viewer, page and day
+        viewer = viewer_telegram_id or viewer_username
+        unique_employee_page_visit_key = f"{ref_by_employee}_{viewer}_{today_date}_{page_url}"
+
+        # Clicks and visits still waiting in click_queue count as well. They are looked at before the SELECT too:
+        # a batch committed while it runs may be released from the queue bookkeeping but missing from its snapshot
+        viewer_key = (viewer, today_date) if viewer else None
+        queued_clicks_before = _queued_viewer_clicks[viewer_key]
+        queued_visit_before = unique_employee_page_visit_key in _queued_visit_keys
+
+        # One round trip for both checks: the viewer's clicks today (max 20 per day per viewer) and whether
+        # this visit was already counted. The timestamp range lets the (viewer, timestamp) indexes serve the count.
+        async with reader() as rdb:
+            cur = await rdb.execute("""
+                SELECT (SELECT COUNT(*) FROM clicks
+                        WHERE (viewer_telegram_id = ? OR viewer_username = ?)
+                        AND timestamp >= ? AND timestamp < ?),
+                       EXISTS (SELECT 1 FROM clicks WHERE unique_daily_key = ? AND is_visit = 1)
+            """, (viewer_telegram_id, viewer_username, today_date, tomorrow_date, unique_employee_page_visit_key))
+            total_clicks_today_for_viewer, already_counted = await cur.fetchone()
+        total_clicks_today_for_viewer += max(queued_clicks_before, _queued_viewer_clicks[viewer_key])
+        is_duplicate_employee_page_visit = (bool(already_counted) or queued_visit_before
+                                            or unique_employee_page_visit_key in _queued_visit_keys)
+
+        if total_clicks_today_for_viewer >= 20:
+            logging.info(f"Daily total click limit reached for {viewer_username}.")
+            return web.Response(body=TRACK_LIMIT_BODY, content_type="application/json")
+
+        counts_as_visit = is_visit_flag and not is_duplicate_employee_page_visit
+
+        # Only a visit not yet counted tries to claim the unique daily key; plain clicks and repeat visits store NULL.
+        # Whether it really counts is settled by click_writer's insert, not by the check above.
+        click_queue.put_nowait(((
+            ref_by_employee, viewer_telegram_id, viewer_username, viewer_full_name,
+            user_agent, page_url, is_visit_flag, True, is_telegram_browser,
+            unique_employee_page_visit_key if counts_as_visit else None
+        ), viewer_key))
+        if viewer_key is not None:
+            _queued_viewer_clicks[viewer_key] += 1
+        if counts_as_visit:
+            _queued_visit_keys.add(unique_employee_page_visit_key)
+
+        logging.info(f"Tracked click for ref: {ref_by_employee}, viewer: {viewer_username}, URL: {page_url}, Visit: {is_visit_flag}, Duplicate Visit: {is_duplicate_employee_page_visit}")
+
+        try:
+            domain_name = page_domain(page_url)
+            status_emoji = "✅ ভিজিট" if is_visit_flag else "🔗 ক্লিক"
+            # Every payload field is untrusted: escape it (hcode/hbold/html_decoration.quote) so Telegram never rejects
+            # the HTML, and cut the long ones so the message stays small
+            notification_message = (f"<b>{status_emoji} রেকর্ড করা হয়েছে!</b>\n"
+                                  f"<b>রেফারেল:</b> {hcode(ref_by_employee)}\n"
+                                  f"<b>ডোমেইন:</b> {html_decoration.quote(domain_name)}\n"
+                                  f"<b>পেজ URL:</b> {hcode(page_url[:NOTIFY_FIELD_LIMIT])}\n"
+                                  f"<b>ভিউয়ার:</b> {hbold(viewer_full_name)} (@{html_decoration.quote(str(viewer_username))})\n"
+                                  f"<b>ব্রাউজার:</b> {'Telegram' if is_telegram_browser else 'External'}\n"
+                                  f"<b>ইউজার এজেন্ট:</b> {hcode(user_agent[:NOTIFY_FIELD_LIMIT])}")
+            if is_visit_flag and is_duplicate_employee_page_visit:
+                notification_message += "\n\n(ℹ️ এই ভিজিটটি আজ এই পেজের জন্য ইতিমধ্যে গণনা করা হয়েছে, তাই এমপ্লয়ির ভিজিট সংখ্যা বাড়ানো হয়নি।)"
+
+            notify_queue.put_nowait((ref_by_employee, is_visit_flag, notification_message))
+        except asyncio.QueueFull:
+            logging.warning(f"Admin notification queue full, dropped notification for ref: {ref_by_employee}")
+        except Exception as e:
+            logging.error(f"Failed to queue admin notification: {e}")
+
+        return web.Response(body=TRACK_QUEUED_BODY, status=202, content_type="application/json")
 
     except Exception as e:
         logging.error(f"Error in track_click_handler: {e}")
-        return web.json_response({"status": "error", "message": str(e)}, status=500)
-
-# --- Main function to run both polling and web server ---
-
-async def main() -> None:
-    polling_task = asyncio.create_task(dp.start_polling(bot))
-
-    app = web.Application()
+        return orjson_response({"status": "error", "message": str(e)}, status=500)
+
+# --- Main function to run the bot (polling or webhook) and the web server ---
+
+# Token bucket per client IP for /track-click: TRACK_RATE_BURST requests at once, refilled at TRACK_RATE_PER_SECOND.
+# A real page view sends a click and one visit; a flood is turned away here before it reaches SQLite.
+# Mobile viewers often share one carrier NAT address, so the limits leave room for many of them at once
+# (about 150 page views a minute per address); the per-employee daily cap is what bounds crediting abuse.
+# Each web worker keeps its own buckets.
+TRACK_RATE_BURST = 60
+TRACK_RATE_PER_SECOND = 5
+_track_rate_buckets = {} # client ip -> (tokens, last refill), least recently used first
+# A bucket left alone this long has refilled completely, so dropping it loses nothing
+TRACK_RATE_IDLE_SECONDS = TRACK_RATE_BURST / TRACK_RATE_PER_SECOND
+
+def evict_rate_buckets(now):
+    # Drops idle buckets from the least recently used end, and the oldest ones while the table is still full,
+    # so a flood of new addresses never resets the buckets of the clients already being limited
+    while _track_rate_buckets:
+        oldest_ip = next(iter(_track_rate_buckets))
+        if len(_track_rate_buckets) < CACHE_MAX_ENTRIES and now - _track_rate_buckets[oldest_ip][1] < TRACK_RATE_IDLE_SECONDS:
+            break
+        del _track_rate_buckets[oldest_ip]
+
+@web.middleware
+async def track_rate_limit(request, handler):
+    if request.path != '/track-click':
+        return await handler(request)
+
+    # Behind Render's proxy the client is the last X-Forwarded-For hop, the one the proxy appended itself;
+    # anything before it comes from the client and can be made up
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    client_ip = forwarded_for.rsplit(",", 1)[-1].strip() if forwarded_for else request.remote
+    now = time.monotonic()
+    tokens, last_refill = _track_rate_buckets.get(client_ip, (TRACK_RATE_BURST, now))
+    tokens = min(TRACK_RATE_BURST, tokens + (now - last_refill) * TRACK_RATE_PER_SECOND)
+    if tokens < 1:
+        return web.Response(body=TRACK_RATE_LIMITED_BODY, status=429, content_type="application/json")
+
+    # Re-inserted so the bucket moves to the most recently used end
+    _track_rate_buckets.pop(client_ip, None)
+    if len(_track_rate_buckets) >= CACHE_MAX_ENTRIES:
+        evict_rate_buckets(now)
+    _track_rate_buckets[client_ip] = (tokens - 1, now)
+    return await handler(request)
+
+async def start_web_server(handle_updates=False):
+    app = web.Application(middlewares=[track_rate_limit])
     app.router.add_post('/track-click', track_click_handler)
+    if handle_updates:
+        # Telegram pushes updates here; the handler drops requests without the right secret token
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
 
     port = int(os.environ.get("PORT", 8080))
-    runner = web.AppRunner(app)
+    # No access log: it would format and write a line for every /track-click request
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', port)
+    # With several workers the kernel spreads incoming connections across their sockets (SO_REUSEPORT)
+    site = web.TCPSite(runner, '0.0.0.0', port, reuse_port=WEB_WORKERS > 1)
     await site.start()
-    logging.info(f"Web server started on port {port}")
+    logging.info(f"Web server started on port {port} (pid {os.getpid()})")
+    return runner
+
+# How long a shutdown may spend flushing queued clicks and notifications before giving up on them
+SHUTDOWN_DRAIN_TIMEOUT = 20
+
+async def run_until_stopped(runner, update_tasks, queue_tasks):
+    # SIGTERM (a redeploy) or SIGINT stops the process cleanly instead of dropping queued work
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    stop_task = asyncio.create_task(stop_event.wait())
+    done, _ = await asyncio.wait([stop_task, *update_tasks, *queue_tasks], return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        if task is not stop_task and not task.cancelled() and task.exception():
+            logging.error(f"Background task failed, shutting down: {task.exception()}")
+    stop_task.cancel()
+    logging.info(f"Shutting down (pid {os.getpid()})")
+
+    try:
+        # Stop taking updates and /track-click requests first, so nothing new reaches the queues
+        for task in update_tasks:
+            task.cancel()
+        await asyncio.gather(*update_tasks, return_exceptions=True)
+        await runner.cleanup()
+
+        try:
+            await asyncio.wait_for(click_queue.join(), SHUTDOWN_DRAIN_TIMEOUT)
+            await asyncio.wait_for(notify_queue.join(), SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning(f"Shutdown drain timed out: {click_queue.qsize()} clicks, {notify_queue.qsize()} notifications left")
+        for task in queue_tasks:
+            task.cancel()
+        await asyncio.gather(*queue_tasks, return_exceptions=True)
+    finally:
+        await bot.session.close()
+        while not read_pool.empty():
+            await read_pool.get_nowait().close()
+        await db.close()
+
+# Extra worker processes only serve /track-click; polling stays in the main process so
+# getUpdates is never called twice. Each worker has its own database connection and queues.
+async def web_worker_main() -> None:
+    await init_db()
+    queue_tasks = [asyncio.create_task(click_writer()), asyncio.create_task(admin_notifier())]
+    runner = await start_web_server()
+    await run_until_stopped(runner, [], queue_tasks)
+
+def run_web_worker():
+    asyncio.run(web_worker_main())
+
+async def main() -> None:
+    await init_db()
+    # Only the main process runs the optimizer and the archiver; they cover the shared database file for the workers too
+    queue_tasks = [asyncio.create_task(click_writer()), asyncio.create_task(admin_notifier()),
+                   asyncio.create_task(db_optimizer()), asyncio.create_task(clicks_archiver())]
+    runner = await start_web_server(handle_updates=USE_WEBHOOK)
+
+    if USE_WEBHOOK:
+        await bot.set_webhook(f"{WEB_SERVER_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                              allowed_updates=dp.resolve_used_update_types())
+        logging.info("Receiving updates via webhook")
+        update_tasks = []
+    else:
+        # getUpdates is refused while a webhook is set, e.g. left over from an earlier webhook deploy
+        await bot.delete_webhook()
+        # 20s long polling: Telegram holds getUpdates open until an update arrives, so idle periods cost few requests.
+        # Signals and the bot session are left to run_until_stopped so queued notifications can still be sent.
+        update_tasks = [asyncio.create_task(dp.start_polling(bot, polling_timeout=20, handle_signals=False,
+                                                             close_bot_session=False))]
 
-    await asyncio.gather(polling_task, site._server.wait_closed())
+    await run_until_stopped(runner, update_tasks, queue_tasks)
 
 if __name__ == '__main__':
+    # uvloop serves both polling and the web server; installed first so forked workers inherit it too
+    if uvloop:
+        uvloop.install()
+    # Workers are started before the event loop exists so nothing loop-bound is inherited
+    for _ in range(WEB_WORKERS - 1):
+        multiprocessing.Process(target=run_web_worker, daemon=True).start()
     asyncio.run(main())